@@ -0,0 +1,72 @@
+"""Compare call overhead of closure pipelines and cooperative mixins.
+
+Plumbing pipelines are nested closures, each plumbing method gets the next
+element of the pipeline passed as ``next_``. The alternative are generated
+mixins, one per layer, each looking up the next layer via ``super`` on every
+call. Run with ``python benchmarks/mixins.py``.
+"""
+
+from plumber import Behavior
+from plumber import plumb
+from plumber import plumbing
+import timeit
+
+
+def create_behavior(index):
+    class Layer(Behavior):
+        @plumb
+        def __getitem__(next_, self, key):
+            return next_(self, key)
+
+    Layer.__name__ = 'Layer%i' % index
+    return Layer
+
+
+def create_plumbing(depth):
+    behaviors = [create_behavior(index) for index in range(depth)]
+
+    @plumbing(*behaviors)
+    class Plumbing(dict):
+        pass
+
+    return Plumbing
+
+
+def create_mixin(func, name):
+    mixin = type('Mixin', (object,), {'__slots__': ()})
+
+    def next_(self, *args, **kw):
+        return getattr(super(mixin, self), name)(*args, **kw)
+
+    def entrance(self, *args, **kw):
+        return func(next_, self, *args, **kw)
+
+    setattr(mixin, name, entrance)
+    return mixin
+
+
+def create_mixins(depth):
+    behaviors = [create_behavior(index) for index in range(depth)]
+    mixins = tuple(
+        create_mixin(behavior.__dict__['__getitem__'].payload, '__getitem__')
+        for behavior in behaviors
+    )
+    return type('Plumbing', mixins + (dict,), {})
+
+
+def main(number=200000):
+    print('%-8s %-6s %12s' % ('variant', 'depth', 'ns per call'))
+    for depth in (1, 3, 5):
+        for variant, factory in (
+            ('closure', create_plumbing),
+            ('mixins', create_mixins),
+        ):
+            plb = factory(depth)()
+            plb['key'] = 'value'
+            timer = timeit.Timer("plb['key']", globals={'plb': plb})
+            best = min(timer.repeat(repeat=5, number=number))
+            print('%-8s %-6i %12.1f' % (variant, depth, best / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Count modifications of plumbing classes after their creation.
+
+Each modification of a class invalidates its type caches. Run with
+``python benchmarks/modifications.py``.
+"""
+from plumber import Behavior
+from plumber import collect
+from plumber import default
+from plumber import plumb
+from plumber import plumber
+from plumber import plumbifexists
+import timeit
+
+
+class counting(plumber):
+    """Plumber counting attribute assignments on created classes."""
+
+    modifications = 0
+
+    def __setattr__(cls, name, value):
+        counting.modifications += 1
+        super(counting, cls).__setattr__(name, value)
+
+
+class Getter(Behavior):
+    @plumb
+    def __getitem__(next_, self, key):
+        return next_(self, key)
+
+    @plumb
+    def get(next_, self, key, default=None):
+        return next_(self, key, default)
+
+
+class Listener(Behavior):
+    @collect
+    def listeners(self):
+        return 'listener'
+
+
+class Fallback(Behavior):
+    @plumbifexists
+    def inexistent(next_, self):
+        return next_(self)  # pragma: no cover
+
+    attr = default(None)
+
+
+def create_endpoint_in_base():
+    class Plumbing(dict, metaclass=counting):
+        __plumbing__ = Getter, Listener
+
+    return Plumbing
+
+
+def create_endpoint_in_body():
+    class Plumbing(dict, metaclass=counting):
+        __plumbing__ = Getter
+
+        def __getitem__(self, key):
+            return dict.__getitem__(self, key)
+
+    return Plumbing
+
+
+def create_subclass():
+    Base = create_endpoint_in_base()
+
+    class Plumbing(Base):
+        __plumbing__ = Getter
+
+    return Plumbing
+
+
+def create_fallback():
+    class Plumbing(dict, metaclass=counting):
+        __plumbing__ = Getter, Fallback
+
+    return Plumbing
+
+
+def main(number=2000):
+    print('%-18s %14s %14s' % ('scenario', 'modifications', 'us per class'))
+    for create in (
+        create_endpoint_in_base,
+        create_endpoint_in_body,
+        create_subclass,
+        create_fallback,
+    ):
+        counting.modifications = 0
+        create()
+        modifications = counting.modifications
+        best = min(timeit.Timer(create).repeat(repeat=5, number=number))
+        scenario = create.__name__[len('create_') :]
+        print('%-18s %14i %14.1f' % (scenario, modifications, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,28 @@
 from .behavior import Behavior  # noqa
+from .behavior import parametric  # noqa
+from .exceptions import FanoutError  # noqa
 from .exceptions import PlumbingCollision  # noqa
+from .instructions import after  # noqa
+from .instructions import batch  # noqa
+from .instructions import before  # noqa
+from .instructions import collect  # noqa
+from .instructions import collectdict  # noqa
+from .instructions import computed  # noqa
 from .instructions import default  # noqa
+from .instructions import extend  # noqa
+from .instructions import fanout  # noqa
 from .instructions import finalize  # noqa
+from .instructions import first  # noqa
 from .instructions import override  # noqa
 from .instructions import plumb  # noqa
+from .instructions import plumbif  # noqa
 from .instructions import plumbifexists  # noqa
+from .instructions import plumbtype  # noqa
+from .instructions import synchronized  # noqa
+from .instructions import when  # noqa
+from .memory import memory_report  # noqa
+from .plumber import has_behavior  # noqa
 from .plumber import plumber  # noqa
 from .plumber import plumbing  # noqa
+from .plumber import replumb  # noqa
+from .plumber import suspended  # noqa
@@ -0,0 +1,22 @@
+"""Command line tools of plumber.
+
+Run ``python -m plumber freeze --help`` for usage.
+"""
+
+from .freeze import main as freeze
+import sys
+
+
+commands = {'freeze': freeze}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in commands:
+        print('usage: python -m plumber {%s} ...' % ','.join(sorted(commands)))
+        return 2
+    return commands[argv[0]](argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,11 @@
 from .instructions import Instruction
+from .instructions import evaluate
 from .instructions import plumb
+import copyreg
+import functools
+import importlib
+import inspect
+import threading
 
 try:
     from .instructions import _implements
@@ -13,6 +19,126 @@ class _Behavior(object):
     """Marker for behavior implementation."""
 
 
+def resolve(behavior):
+    """Resolve a behavior given as dotted path.
+
+    The path is either ``package.module.Behavior`` or
+    ``package.module:Namespace.Behavior``. Parametric behaviors are
+    specialized with default parameters. Other behaviors are returned as is.
+
+    .. code-block:: pycon
+
+        >>> from plumber.behavior import resolve
+
+        >>> resolve('plumber.behavior.Behavior')
+        <class 'plumber.behavior.Behavior'>
+
+        >>> resolve('plumber.behavior:Behavior')
+        <class 'plumber.behavior.Behavior'>
+    """
+    if isinstance(behavior, str):
+        if ':' in behavior:
+            module, path = behavior.split(':')
+        else:
+            module, path = behavior.rsplit('.', 1)
+        obj = importlib.import_module(module)
+        for name in path.split('.'):
+            obj = getattr(obj, name)
+        behavior = obj
+    if isinstance(behavior, parametric):
+        return behavior()
+    return behavior
+
+
+class Conditional(object):
+    """Behavior only used if predicate is true at plumbing class creation.
+
+    The behavior may be given as dotted path, it is only imported if the
+    predicate is true.
+    """
+
+    def __init__(self, behavior, predicate):
+        self.behavior = behavior
+        self.predicate = predicate
+
+    @property
+    def enabled(self):
+        return evaluate(self.predicate)
+
+    def __repr__(self):
+        return '<Conditional %r>' % self.behavior
+
+
+class parametric(object):
+    """Behavior parametrized by the arguments of a factory.
+
+    The factory returns a behavior class, its instructions close over the
+    parameters. Calling the parametric behavior returns the specialization for
+    the given parameters, which is created once and then looked up by the
+    bound parameters. Thus equal parametrizations yield the very same
+    behavior and instructions. Parameters must be hashable.
+    """
+
+    def __init__(self, factory):
+        functools.update_wrapper(self, factory)
+        self.factory = factory
+        self.signature = inspect.signature(factory)
+        self.specializations = dict()
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kw):
+        bound = self.signature.bind(*args, **kw)
+        bound.apply_defaults()
+        key = tuple(bound.arguments.items())
+        try:
+            behavior = self.specializations.get(key)
+        except TypeError:
+            names = list()
+            for name, value in key:
+                try:
+                    hash(value)
+                except TypeError:
+                    names.append(name)
+            raise TypeError(
+                'Parameters of %s must be hashable: %s'
+                % (self.__qualname__, ', '.join(names))
+            )
+        if behavior is not None:
+            return behavior
+        with self.lock:
+            behavior = self.specializations.get(key)
+            if behavior is None:
+                behavior = self.specialize(bound, key)
+                self.specializations[key] = behavior
+        return behavior
+
+    def specialize(self, bound, key):
+        behavior = self.factory(*bound.args, **bound.kwargs)
+        if not isinstance(behavior, behaviormetaclass):
+            raise TypeError('%s did not return a behavior' % self.__qualname__)
+        # Specializations are identified by module and qualified name, e.g.
+        # when replumbing.
+        behavior.__module__ = self.__module__
+        behavior.__qualname__ = '%s(%s)' % (
+            self.__qualname__,
+            ', '.join('%s=%r' % item for item in key),
+        )
+        behavior.__parametric__ = self
+        behavior.__parameters__ = dict(key)
+        return behavior
+
+    def __reduce__(self):
+        return self.__qualname__
+
+    def __repr__(self):
+        return '<parametric %s>' % self.__qualname__
+
+
+def specialize(parametric, parameters):
+    """Specialization of ``parametric`` for unpickling."""
+    return parametric(**parameters)
+
+
 class Instructions(object):
     """Adapter to set instructions on a behavior."""
 
@@ -107,4 +233,21 @@ class behaviormetaclass(type):
 # Base class for plumbing behaviors: identification and metaclass setting
 # No doctest allowed here, it would be recognized as an instruction.
 class Behavior(_Behavior, metaclass=behaviormetaclass):
-    pass
+    @classmethod
+    def when(cls, predicate):
+        # Use behavior only if predicate is true at plumbing class creation.
+        return Conditional(cls, predicate)
+
+
+def reduce_behavior(behavior):
+    """Reduce a behavior for pickling.
+
+    Specializations of parametric behaviors reduce to their parameters, all
+    others are pickled by reference.
+    """
+    if '__parametric__' not in behavior.__dict__:
+        return behavior.__qualname__
+    return specialize, (behavior.__parametric__, behavior.__parameters__)
+
+
+copyreg.pickle(behaviormetaclass, reduce_behavior)
@@ -0,0 +1,213 @@
+"""Record which layers of plumbing pipelines run.
+
+While collecting, pipelines get rebuilt with instrumented layers counting
+their calls. Sampled calls are checked for passing through, i.e. calling
+``next_`` once with unchanged arguments and returning its result unchanged.
+Layers never called and layers always passing through are candidates for
+pruning ``__plumbing__``.
+"""
+
+from .instructions import after
+from .instructions import before
+from .instructions import chainfor
+from .instructions import plumb
+from .instructions import plumbifexists
+from .instructions import synchronizedfor
+from .plumber import key_of
+from .plumber import plumbing_classes
+import contextlib
+import copy
+import functools
+import inspect
+import json
+import types
+
+
+# Instructions which layers can be instrumented.
+_instrumented = (plumb, plumbifexists, before, after)
+
+
+class LayerStats(object):
+    """Calls of a layer and how many of the sampled calls passed through."""
+
+    def __init__(self, hook=False):
+        self.hook = hook
+        self.calls = 0
+        self.sampled = 0
+        self.passthrough = 0
+
+    @property
+    def status(self):
+        if not self.calls:
+            return 'dead'
+        if self.sampled and self.passthrough == self.sampled:
+            return 'passthrough'
+        return 'active'
+
+
+def unchanged(args, kw, self_, args_, kw_, self):
+    """Whether arguments passed to ``next_`` are the very same."""
+    if self_ is not self or len(args) != len(args_) or kw.keys() != kw_.keys():
+        return False
+    for arg, arg_ in zip(args, args_):
+        if arg is not arg_:
+            return False
+    for name, value in kw.items():
+        if kw_[name] is not value:
+            return False
+    return True
+
+
+def instrumentfor(func, stats, sample):
+    """A plumbing method counting calls of func and sampling whether it
+    passes through.
+    """
+
+    @functools.wraps(func)
+    def layer(next_, self, *args, **kw):
+        stats.calls += 1
+        if stats.calls % sample:
+            return func(next_, self, *args, **kw)
+        stats.sampled += 1
+        forwarded = []
+
+        def observed(self_, *args_, **kw_):
+            result = next_(self_, *args_, **kw_)
+            forwarded.append((unchanged(args, kw, self_, args_, kw_, self), result))
+            return result
+
+        result = func(observed, self, *args, **kw)
+        if len(forwarded) == 1 and forwarded[0][0] and forwarded[0][1] is result:
+            stats.passthrough += 1
+        return result
+
+    return layer
+
+
+def hookfor(func, stats):
+    """A hook counting calls of func."""
+
+    @functools.wraps(func)
+    def hook(self, *args, **kw):
+        stats.calls += 1
+        return func(self, *args, **kw)
+
+    return hook
+
+
+class Coverage(object):
+    """Layers of plumbing pipelines and their stats."""
+
+    def __init__(self, sample=1):
+        self.sample = sample
+        # Stats by class, behavior and method.
+        self.layers = dict()
+        # Behaviors declared by instrumented classes.
+        self.plumbings = dict()
+
+    def instrument(self, cls, name):
+        """Instrumented entrance of pipeline ``name`` of cls, or ``None``."""
+        stacks = cls.__dict__['__plumbing_stacks__']
+        layers = stacks.layers[name]
+        for layer in layers:
+            if type(layer) not in _instrumented:
+                return None
+            if not isinstance(layer.payload, types.FunctionType):
+                return None
+            if inspect.iscoroutinefunction(layer.payload):
+                return None
+        instrumented = []
+        for layer in layers:
+            hook = isinstance(layer, (before, after))
+            stats_key = (key_of(cls), key_of(layer.__parent__), name)
+            stats = self.layers.get(stats_key)
+            if stats is None:
+                stats = self.layers[stats_key] = LayerStats(hook=hook)
+            layer = copy.copy(layer)
+            if hook:
+                layer.item = hookfor(layer.payload, stats)
+            else:
+                layer.item = instrumentfor(layer.payload, stats, self.sample)
+            instrumented.append(layer)
+        entrance = chainfor(tuple(instrumented), stacks.endpoints[name])
+        return synchronizedfor(instrumented, entrance, stacks)
+
+    def report(self):
+        """Stats of all layers, ordered by class, behavior and method."""
+        return [
+            dict(
+                cls=cls,
+                behavior=behavior,
+                method=method,
+                calls=stats.calls,
+                sampled=stats.sampled,
+                passthrough=None if stats.hook else stats.passthrough,
+                status=stats.status,
+            )
+            for (cls, behavior, method), stats in sorted(self.layers.items())
+        ]
+
+    def dead_behaviors(self):
+        """Behaviors declared by classes which layers were never called, by
+        class.
+        """
+        called = dict()
+        for (cls, behavior, _), stats in self.layers.items():
+            called.setdefault(cls, dict())
+            called[cls][behavior] = called[cls].get(behavior, 0) + stats.calls
+        dead = dict()
+        for cls, behaviors in sorted(self.plumbings.items()):
+            unused = [
+                behavior
+                for behavior in behaviors
+                if called.get(cls, {}).get(behavior, None) == 0
+            ]
+            if unused:
+                dead[cls] = unused
+        return dead
+
+    def export(self, path):
+        """Write the report and dead behaviors as JSON to path."""
+        with open(path, 'w') as file:
+            json.dump(
+                dict(layers=self.report(), dead_behaviors=self.dead_behaviors()),
+                file,
+                indent=2,
+            )
+
+
+@contextlib.contextmanager
+def collect(*classes, sample=1):
+    """Collect coverage of the method pipelines of plumbing classes.
+
+    Without classes, all plumbing classes are instrumented. Each call of a
+    layer is counted, every ``sample``-th call is checked for passing
+    through. Pipelines of ``plumb``, ``before`` and ``after`` instructions
+    are instrumented. Counts are not synchronized, under concurrency they are
+    approximate.
+    """
+    if not classes:
+        classes = plumbing_classes()
+    coverage = Coverage(sample=sample)
+    installed = []
+    for cls in classes:
+        stacks = cls.__dict__.get('__plumbing_stacks__')
+        if stacks is None:
+            continue
+        coverage.plumbings[key_of(cls)] = [
+            key_of(behavior) for behavior in cls.__dict__['__plumbing__']
+        ]
+        for name, entrance in stacks.entrances.items():
+            if cls.__dict__.get(name) is not entrance:
+                continue
+            instrumented = coverage.instrument(cls, name)
+            if instrumented is None:
+                continue
+            setattr(cls, name, instrumented)
+            installed.append((cls, name, entrance, instrumented))
+    try:
+        yield coverage
+    finally:
+        for cls, name, entrance, instrumented in installed:
+            if cls.__dict__.get(name) is instrumented:
+                setattr(cls, name, entrance)
@@ -11,3 +11,17 @@ class PlumbingCollision(RuntimeError):
             ]
         ) % (left, right)
         super(PlumbingCollision, self).__init__(msg)
+
+
+class FanoutError(RuntimeError):
+    """Errors raised by the methods of a ``fanout`` instruction."""
+
+    def __init__(self, name, errors):
+        self.name = name
+        self.errors = errors
+        msg = '%i method(s) of fanout %s failed: %s' % (
+            len(errors),
+            name,
+            ', '.join(repr(error) for error in errors),
+        )
+        super(FanoutError, self).__init__(msg)
@@ -0,0 +1,691 @@
+"""Freeze plumbing classes into plain Python source.
+
+The plumbing classes of a module are emitted as plain classes into a
+generated module, which imports without any metaclass work. Method
+pipelines are emitted as chains of generated functions calling the plumbing
+methods of the behaviors, attributes resolved by stage 1 instructions are
+assigned directly. Run ``python -m plumber freeze --help`` for usage.
+"""
+
+from .instructions import Instruction
+from .instructions import after
+from .instructions import before
+from .instructions import plumb
+from .instructions import plumbifexists
+from .plumber import _is_importable
+from .plumber import plumber
+import argparse
+import ast
+import dis
+import importlib
+import inspect
+import math
+import os
+import re
+import sys
+import textwrap
+import types
+
+
+# Attributes of plumbing classes not emitted into frozen classes. Python 3.13
+# sets __firstlineno__ and __static_attributes__ compiling class bodies. The
+# behaviors are not emitted, referring to them would import their modules.
+_ignores = frozenset(
+    [
+        '__module__',
+        '__qualname__',
+        '__firstlineno__',
+        '__static_attributes__',
+        '__dict__',
+        '__weakref__',
+        '__plumbing__',
+        '__plumbing_behaviors__',
+        '__plumbing_stacks__',
+        '__plumbing_namespace__',
+    ]
+)
+
+# Instructions which pipelines can be frozen.
+_freezable = (plumb, plumbifexists, before, after)
+
+_literals = (type(None), bool, int, float, complex, str, bytes)
+
+
+class FreezeError(ValueError):
+    """Raised if a plumbing class or one of its attributes can not be frozen."""
+
+
+def frozen_name(module):
+    """Name of the frozen counterpart of module."""
+    return module + '_frozen'
+
+
+def plumbing_classes(module):
+    """Plumbing classes defined at top level of module, in definition order."""
+    return [
+        value
+        for name, value in vars(module).items()
+        if isinstance(value, plumber)
+        and '__plumbing_stacks__' in value.__dict__
+        and value.__module__ == module.__name__
+        and value.__qualname__ == name
+    ]
+
+
+def literal(value):
+    """Whether value can be emitted by its representation."""
+    if type(value) in _literals:
+        return True
+    if type(value) in (tuple, list, set, frozenset):
+        return all(literal(item) for item in value)
+    if type(value) is dict:
+        return all(literal(key) and literal(item) for key, item in value.items())
+    return False
+
+
+def global_names(code):
+    """Global names loaded by code, including nested code objects."""
+    names = set()
+    for instruction in dis.get_instructions(code):
+        if instruction.opname in ('LOAD_GLOBAL', 'STORE_GLOBAL', 'DELETE_GLOBAL'):
+            names.add(instruction.argval)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.update(global_names(const))
+    return names
+
+
+class Freezer(object):
+    """Emit the plumbing classes of a module as plain Python source.
+
+    ``frozen`` maps names of modules which get frozen as well to the names of
+    their frozen counterparts, base classes from these modules are referred
+    to by their frozen counterpart.
+    """
+
+    def __init__(self, module, frozen=None):
+        self.module = module
+        self.frozen = dict(frozen or {})
+        self.frozen.setdefault(module.__name__, frozen_name(module.__name__))
+        self.imports = []
+        self.lines = []
+        # Module level names of the generated module and their values.
+        self.names = dict()
+        # Source expressions by id of referred objects.
+        self.refs = dict()
+        self.counter = 0
+        # Aliases of imported objects by module and top level name.
+        self.imported = dict()
+        self.classes = plumbing_classes(module)
+        for cls in self.classes:
+            self.names[cls.__name__] = cls
+        self.done = []
+        self.skipped = []
+
+    def source(self):
+        """Generate the source of the frozen module."""
+        classes = []
+        skipped = self.skipped
+        for cls in self.classes:
+            lines = self.lines
+            state = (
+                list(self.imports),
+                dict(self.names),
+                dict(self.refs),
+                dict(self.imported),
+            )
+            self.lines = []
+            self.cells = []
+            try:
+                self.freeze_class(cls)
+            except FreezeError as e:
+                self.lines = lines
+                self.imports, self.names, self.refs, self.imported = state
+                self.imports.append(
+                    'from %s import %s  # not frozen: %s'
+                    % (self.module.__name__, cls.__name__, e)
+                )
+                skipped.append((cls, e))
+                continue
+            self.lines = lines + self.lines
+            classes.append(cls.__name__)
+        header = [
+            '"""Frozen plumbing classes of ``%s``.' % self.module.__name__,
+            '',
+            'Generated by ``python -m plumber freeze``, do not edit.',
+            '"""',
+        ]
+        footer = ['', '', '__frozen__ = %r' % (tuple(classes),), '']
+        return '\n'.join(header + self.imports + self.lines + footer)
+
+    def name(self, preferred, value):
+        """Reserve a module level name for value."""
+        name = preferred
+        index = 1
+        while name in self.names and self.names[name] is not value:
+            index += 1
+            name = '%s_%i' % (preferred, index)
+        self.names[name] = value
+        return name
+
+    def bind(self, expr, value):
+        """Bind expr to a module level name unless it is one already."""
+        if expr.isidentifier():
+            return expr
+        name = self.refs.get(id(value))
+        if name is not None and name.isidentifier():
+            return name
+        self.counter += 1
+        name = self.name('_ref_%i' % self.counter, value)
+        self.lines.append('%s = %s' % (name, expr))
+        self.refs[id(value)] = name
+        return name
+
+    def refer(self, value):
+        """Source expression evaluating to value in the generated module."""
+        if literal(value):
+            return self.literal(value)
+        expr = self.refs.get(id(value))
+        if expr is not None:
+            return expr
+        expr = self.locate(value)
+        self.refs[id(value)] = expr
+        return expr
+
+    def literal(self, value):
+        if type(value) is float and not math.isfinite(value):
+            return 'float(%r)' % repr(value)
+        if type(value) in (set, frozenset):
+            items = ', '.join(self.literal(item) for item in value)
+            return '%s([%s])' % (type(value).__name__, items)
+        if type(value) in (tuple, list):
+            items = ', '.join(self.literal(item) for item in value)
+            if type(value) is tuple:
+                return '(%s%s)' % (items, ',' if len(value) == 1 else '')
+            return '[%s]' % items
+        if type(value) is dict:
+            return '{%s}' % ', '.join(
+                '%s: %s' % (self.literal(key), self.literal(item))
+                for key, item in value.items()
+            )
+        return repr(value)
+
+    def locate(self, value):
+        if isinstance(value, types.ModuleType):
+            if value is self.module:
+                raise FreezeError('%s would be imported' % value.__name__)
+            name = self.name('_' + value.__name__.replace('.', '_'), value)
+            self.imports.append('import %s as %s' % (value.__name__, name))
+            return name
+        if type(value) is property:
+            return 'property(%s)' % ', '.join(
+                self.refer(item)
+                for item in (value.fget, value.fset, value.fdel, value.__doc__)
+            )
+        if type(value) is types.MappingProxyType and literal(dict(value)):
+            return '%s.MappingProxyType(%s)' % (
+                self.refer(types),
+                self.literal(dict(value)),
+            )
+        if type(value) in (staticmethod, classmethod):
+            return '%s(%s)' % (type(value).__name__, self.refer(value.__func__))
+        if type(value) in (frozenset, tuple) and all(
+            isinstance(item, type) for item in value
+        ):
+            items = [self.refer(item) for item in value]
+            if type(value) is frozenset:
+                items.sort()
+            return '%s([%s])' % (type(value).__name__, ', '.join(items))
+        if isinstance(value, type) and value in self.names.values():
+            if value in self.done or value in [cls for cls, _ in self.skipped]:
+                return value.__name__
+            if value in self.classes:
+                raise FreezeError('%s gets frozen later' % value.__qualname__)
+        reasons = []
+        if isinstance(value, types.FunctionType):
+            if value.__module__ == self.module.__name__:
+                try:
+                    return self.copy(value)
+                except FreezeError as e:
+                    reasons.append(str(e))
+        expr = self.payload_of(value)
+        if expr is not None:
+            return expr
+        expr = self.importable(value)
+        if expr is not None:
+            return expr
+        reasons.append('%r can not be referred to' % (value,))
+        raise FreezeError(reasons[0])
+
+    def payload_of(self, value):
+        """Refer to value as payload of a behavior instruction."""
+        for behavior in self.behaviors:
+            if behavior.__module__ == self.module.__name__:
+                continue
+            for name, instruction in vars(behavior).items():
+                if not isinstance(instruction, Instruction):
+                    continue
+                if instruction.payload is value:
+                    return '%s.__dict__[%r].payload' % (self.refer(behavior), name)
+        return None
+
+    def importable(self, value):
+        """Refer to value by its module and qualified name.
+
+        Raises ``FreezeError`` if value would be imported from the frozen
+        module, which must not be imported by its frozen counterpart.
+        """
+        module = getattr(value, '__module__', None)
+        qualname = getattr(value, '__qualname__', None)
+        if not isinstance(module, str) or not isinstance(qualname, str):
+            objclass = getattr(value, '__objclass__', None)
+            if objclass is None:
+                return None
+            return '%s.__dict__[%r]' % (self.refer(objclass), value.__name__)
+        if module not in sys.modules:
+            return None
+        parent = sys.modules[module]
+        obj = parent
+        for part in qualname.split('.'):
+            parent = obj
+            obj = getattr(obj, part, None)
+        lookup = ''
+        if obj is not value:
+            if vars(parent).get(part) is not value:
+                return None
+            lookup = '.__dict__[%r]' % part
+            qualname = qualname.rpartition('.')[0]
+        if module == self.module.__name__:
+            raise FreezeError(
+                '%s would be imported from %s' % (value.__qualname__, module)
+            )
+        if module in self.frozen and module != self.module.__name__:
+            # Refer to frozen counterparts of classes of other frozen modules.
+            if value in plumbing_classes(sys.modules[module]):
+                module = self.frozen[module]
+        top, _, rest = qualname.partition('.')
+        key = (module, top)
+        name = self.imported.get(key)
+        if name is None:
+            name = self.imported[key] = self.name('_' + top, key)
+            self.imports.append('from %s import %s as %s' % (module, top, name))
+        if rest:
+            name = '%s.%s' % (name, rest)
+        return name + lookup
+
+    def copy(self, func):
+        """Copy the source of a function of the frozen module.
+
+        Decorators are dropped, the copied source must compile to the code
+        of func. Functions referring to ``__class__``, i.e. using ``super``,
+        are created by a factory providing the cell, which gets set to the
+        frozen class once it is created.
+        """
+        qualname = func.__qualname__
+        if func.__code__.co_freevars not in ((), ('__class__',)):
+            raise FreezeError('%s is a closure' % qualname)
+        if func.__name__ == '<lambda>':
+            raise FreezeError('%s is a lambda' % qualname)
+        for value in (func.__defaults__ or ()) + tuple(
+            (func.__kwdefaults__ or {}).values()
+        ):
+            if not literal(value):
+                raise FreezeError('%s has non literal defaults' % qualname)
+        for value in func.__annotations__.values():
+            if not isinstance(value, str) and value.__module__ != 'builtins':
+                raise FreezeError('%s has annotations' % qualname)
+        try:
+            source = textwrap.dedent(inspect.getsource(func))
+            node = ast.parse(source).body[0]
+        except (OSError, TypeError, SyntaxError):
+            raise FreezeError('source of %s not available' % qualname)
+        name = self.name('_' + qualname.replace('.', '_'), func)
+        lines = source.rstrip().splitlines()[node.lineno - 1 :]
+        lines[0] = re.sub(r'def\s+\w+', 'def ' + name, lines[0], count=1)
+        cell = None
+        if func.__code__.co_freevars:
+            cell = func.__closure__[0].cell_contents
+            # Classes decorated by ``plumbing`` replace the class the cell
+            # refers to.
+            cell = vars(self.module).get(cell.__qualname__, cell)
+            lines = (
+                ['def _make%s():' % name, '    __class__ = None']
+                + ['    ' + line for line in lines]
+                + ['    return %s' % name, '', '', '%s = _make%s()' % (name, name)]
+            )
+        code = compile('\n'.join(lines), '<frozen>', 'exec')
+        while code.co_name != name:
+            code = [
+                const for const in code.co_consts if isinstance(const, types.CodeType)
+            ][0]
+        if not same_code(code, func.__code__):
+            raise FreezeError('source of %s does not match its code' % qualname)
+        self.refs[id(func)] = name
+        try:
+            for global_name in sorted(global_names(func.__code__)):
+                if global_name not in func.__globals__:
+                    continue
+                value = func.__globals__[global_name]
+                if self.names.get(global_name) is value:
+                    continue
+                if global_name in self.names:
+                    raise FreezeError(
+                        'global %s of %s conflicts' % (global_name, qualname)
+                    )
+                self.names[global_name] = value
+                self.lines.append('%s = %s' % (global_name, self.refer(value)))
+        except FreezeError:
+            del self.refs[id(func)]
+            raise
+        self.lines += [''] + lines + ['']
+        self.lines.append('%s.__name__ = %r' % (name, func.__name__))
+        self.lines.append('%s.__qualname__ = %r' % (name, qualname))
+        if cell is not None:
+            self.cells.append((name, cell))
+        return name
+
+    def pipeline(self, cls, name):
+        """Emit the pipeline of attribute name as chain of functions."""
+        stacks = cls.__plumbing_stacks__
+        layers = stacks.layers[name]
+        entrance = stacks.entrances[name]
+        for layer in layers:
+            if type(layer) not in _freezable:
+                raise FreezeError(
+                    '%s pipelines can not be frozen' % type(layer).__name__
+                )
+            if layer.__lock__ is not None:
+                raise FreezeError('synchronized pipelines can not be frozen')
+            if not isinstance(layer.payload, types.FunctionType):
+                raise FreezeError('property pipelines can not be frozen')
+        prefix = '_%s_%s' % (cls.__name__, name.strip('_'))
+        endpoint = stacks.endpoints[name]
+        next_ = self.bind(self.refer(endpoint), endpoint)
+        chain = [next_]
+        befores = []
+        afters = []
+        for layer in reversed(layers):
+            func = self.bind(self.refer(layer.payload), layer.payload)
+            chain.insert(0, func)
+            if isinstance(layer, before):
+                befores.insert(0, func)
+                continue
+            if isinstance(layer, after):
+                afters.append(func)
+                continue
+            if befores or afters:
+                next_ = self.hooks(prefix, befores, afters, next_)
+                befores = []
+                afters = []
+            next_ = self.function(
+                prefix, ['return %s(%s, self, *args, **kw)' % (func, next_)]
+            )
+        if befores or afters:
+            next_ = self.hooks(prefix, befores, afters, next_)
+        self.lines.append('%s.__name__ = %r' % (next_, entrance.__name__))
+        self.lines.append('%s.__qualname__ = %r' % (next_, cls.__name__ + '.' + name))
+        self.lines.append('%s.__doc__ = %r' % (next_, entrance.__doc__))
+        self.lines.append('%s.__plumbing_chain__ = (%s,)' % (next_, ', '.join(chain)))
+        return next_
+
+    def hooks(self, prefix, befores, afters, next_):
+        body = ['%s(self, *args, **kw)' % hook for hook in befores]
+        if afters:
+            body.append('result = %s(self, *args, **kw)' % next_)
+            body += ['%s(self, *args, **kw)' % hook for hook in afters]
+            body.append('return result')
+        else:
+            body.append('return %s(self, *args, **kw)' % next_)
+        return self.function(prefix, body)
+
+    def function(self, prefix, body):
+        self.counter += 1
+        name = self.name('%s_%i' % (prefix, self.counter), None)
+        self.lines += ['', 'def %s(self, *args, **kw):' % name]
+        self.lines += ['    ' + line for line in body]
+        self.lines.append('')
+        return name
+
+    def freeze_class(self, cls):
+        if type(cls) is not plumber:
+            raise FreezeError('metaclass %s' % type(cls).__qualname__)
+        self.behaviors = sorted(
+            cls.__dict__.get('__plumbing_behaviors__', ()),
+            key=lambda behavior: behavior.__qualname__,
+        )
+        stacks = cls.__plumbing_stacks__
+        bases = []
+        for base in cls.__bases__:
+            if base not in self.done and not _is_importable(base):
+                raise FreezeError('base %s is not importable' % base.__qualname__)
+            bases.append(self.refer(base))
+        slots = cls.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        body = []
+        for name, value in cls.__dict__.items():
+            if name in _ignores or name in slots:
+                continue
+            if name in stacks.entrances and stacks.entrances[name] is value:
+                expr = self.pipeline(cls, name)
+            else:
+                expr = self.refer(value)
+            body.append('    %s = %s' % (name, expr))
+        self.lines += ['', '']
+        self.lines.append('class %s(%s):' % (cls.__name__, ', '.join(bases)))
+        self.lines += body or ['    pass']
+        self.done.append(cls)
+        # Set the ``__class__`` cells of copied functions using ``super``.
+        if self.cells:
+            self.lines.append('')
+        for name, cell in self.cells:
+            self.lines.append(
+                '%s.__closure__[0].cell_contents = %s' % (name, self.refer(cell))
+            )
+
+
+def freeze(module, frozen=None):
+    """Generate the source of the frozen counterpart of module.
+
+    Returns the source and the plumbing classes which could not be frozen
+    together with the reason. These are imported from module by the frozen
+    module.
+    """
+    freezer = Freezer(module, frozen=frozen)
+    return freezer.source(), freezer.skipped
+
+
+###############################################################################
+# Verification
+###############################################################################
+
+
+# Opcodes depending on whether the compiler knows a name is a module, i.e.
+# if it is imported in the compiled module. Attributes of modules are loaded
+# as attributes instead of methods, which pushes a NULL in front of the
+# callable, before or after loading it depending on the Python version.
+_methods = {'LOAD_METHOD': 'LOAD_ATTR', 'CALL_METHOD': 'CALL_FUNCTION'}
+_ignored = frozenset(['PUSH_NULL'])
+
+_jumps = frozenset(dis.hasjrel + dis.hasjabs)
+
+
+def instructions(code):
+    """Instructions of code, independent of the compiled module."""
+    return [
+        (
+            _methods.get(instruction.opname, instruction.opname),
+            None if instruction.opcode in _jumps else instruction.argval,
+        )
+        for instruction in dis.get_instructions(code)
+        if instruction.opname not in _ignored
+        and not isinstance(instruction.argval, types.CodeType)
+    ]
+
+
+def same_code(left, right):
+    """Whether code objects are compiled from the same source."""
+    for attr in ('co_names', 'co_varnames', 'co_argcount', 'co_kwonlyargcount'):
+        if getattr(left, attr) != getattr(right, attr):
+            return False
+    if instructions(left) != instructions(right):
+        return False
+    lcodes = [const for const in left.co_consts if isinstance(const, types.CodeType)]
+    rcodes = [const for const in right.co_consts if isinstance(const, types.CodeType)]
+    if len(lcodes) != len(rcodes):
+        return False
+    return all(same_code(lcode, rcode) for lcode, rcode in zip(lcodes, rcodes))
+
+
+class Verifier(object):
+    """Compare plumbing classes with their frozen counterparts."""
+
+    def __init__(self, modules):
+        # Frozen classes by live class.
+        self.counterparts = dict()
+        for live, frozen in modules:
+            for name in frozen.__frozen__:
+                self.counterparts[getattr(live, name)] = getattr(frozen, name)
+
+    def chain(self, cls, name, entrance):
+        """Plumbing methods and endpoint of a live entrance, or None."""
+        for klass in cls.__mro__:
+            stacks = klass.__dict__.get('__plumbing_stacks__')
+            if stacks is None or stacks.entrances.get(name) is not entrance:
+                continue
+            payloads = [layer.payload for layer in stacks.layers[name]]
+            return payloads + [stacks.endpoints[name]]
+        return None
+
+    def equivalent(self, left, right, cls=None, name=None):
+        if left is right:
+            return True
+        if isinstance(left, type):
+            return self.counterparts.get(left) is right
+        if type(left) is not type(right):
+            return False
+        if isinstance(left, types.FunctionType):
+            frozen_chain = getattr(right, '__plumbing_chain__', None)
+            if frozen_chain is not None:
+                live_chain = self.chain(cls, name, left)
+                if live_chain is None or len(live_chain) != len(frozen_chain):
+                    return False
+                return all(
+                    self.equivalent(lfunc, rfunc)
+                    for lfunc, rfunc in zip(live_chain, frozen_chain)
+                )
+            return (
+                same_code(left.__code__, right.__code__)
+                and left.__defaults__ == right.__defaults__
+                and left.__kwdefaults__ == right.__kwdefaults__
+            )
+        if isinstance(left, property):
+            return all(
+                self.equivalent(getattr(left, attr), getattr(right, attr))
+                for attr in ('fget', 'fset', 'fdel', '__doc__')
+            )
+        if isinstance(left, (staticmethod, classmethod)):
+            return self.equivalent(left.__func__, right.__func__)
+        if isinstance(left, (frozenset, tuple)):
+            if len(left) != len(right):
+                return False
+            if isinstance(left, frozenset):
+                return (
+                    frozenset(self.counterparts.get(item, item) for item in left)
+                    == right
+                )
+            return all(self.equivalent(lv, rv) for lv, rv in zip(left, right))
+        try:
+            return bool(left == right)
+        except Exception:
+            return False
+
+    def verify(self, live, frozen):
+        """Mismatches between live and frozen class."""
+        qualname = '%s:%s' % (live.__module__, live.__qualname__)
+        mismatches = []
+        if len(live.__mro__) != len(frozen.__mro__) or not all(
+            self.equivalent(lbase, fbase)
+            for lbase, fbase in zip(live.__mro__[1:], frozen.__mro__[1:])
+        ):
+            mismatches.append('%s: method resolution order differs' % qualname)
+        names = set(dir(live)) - _ignores
+        frozen_names = set(dir(frozen)) - _ignores
+        for name in sorted(names ^ frozen_names):
+            mismatches.append('%s.%s: only in one class' % (qualname, name))
+        for name in sorted(names & frozen_names):
+            left = inspect.getattr_static(live, name)
+            right = inspect.getattr_static(frozen, name)
+            if not self.equivalent(left, right, live, name):
+                mismatches.append('%s.%s: resolves differently' % (qualname, name))
+        return mismatches
+
+
+def verify(modules):
+    """Verify frozen modules against live modules.
+
+    ``modules`` is an iterable of pairs of live and frozen module. Returns a
+    list of mismatches, empty if all frozen classes resolve identically to
+    their live counterparts.
+    """
+    modules = list(modules)
+    verifier = Verifier(modules)
+    mismatches = []
+    for live, frozen in modules:
+        for name in frozen.__frozen__:
+            mismatches += verifier.verify(getattr(live, name), getattr(frozen, name))
+    return mismatches
+
+
+###############################################################################
+# Command line
+###############################################################################
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m plumber freeze',
+        description='Freeze plumbing classes of modules into plain Python source.',
+    )
+    parser.add_argument('modules', nargs='+', metavar='module')
+    parser.add_argument(
+        '-o',
+        '--output',
+        help='directory to write frozen modules to, '
+        'defaults to the package of the module',
+    )
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='verify existing frozen modules instead of writing them',
+    )
+    args = parser.parse_args(argv)
+    if args.output:
+        sys.path.insert(0, args.output)
+    frozen = dict()
+    for name in args.modules:
+        if args.output:
+            frozen[name] = frozen_name(name.rpartition('.')[2])
+        else:
+            frozen[name] = frozen_name(name)
+    modules = [importlib.import_module(name) for name in args.modules]
+    if args.verify:
+        mismatches = verify(
+            (module, importlib.import_module(frozen[module.__name__]))
+            for module in modules
+        )
+        for mismatch in mismatches:
+            print(mismatch)
+        return 1 if mismatches else 0
+    for module in modules:
+        source, skipped = freeze(module, frozen=frozen)
+        directory = args.output or os.path.dirname(module.__file__)
+        path = os.path.join(
+            directory, frozen[module.__name__].rpartition('.')[2] + '.py'
+        )
+        with open(path, 'w') as file:
+            file.write(source)
+        print('%s -> %s' % (module.__name__, path))
+        for cls, error in skipped:
+            print('  %s not frozen: %s' % (cls.__qualname__, error))
+    return 0
@@ -1,3 +1,4 @@
+from .exceptions import FanoutError
 from .exceptions import PlumbingCollision
 
 try:
@@ -7,7 +8,14 @@ try:
     ZOPE_INTERFACE_AVAILABLE = True
 except ImportError:  # pragma: no cover
     ZOPE_INTERFACE_AVAILABLE = False
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import inspect
 import re
+import threading
+import types
+import weakref
 
 
 ###############################################################################
@@ -107,6 +115,120 @@ def plumb_str(leftdoc, rightdoc):
     return leftdoc.replace('__plbnext__', rightdoc.rstrip())
 
 
+def evaluate(predicate):
+    """Evaluate predicate of a conditional instruction or behavior.
+
+    .. code-block:: pycon
+
+        >>> from plumber.instructions import evaluate
+
+        >>> evaluate(None)
+        True
+
+        >>> evaluate(False)
+        False
+
+        >>> evaluate(lambda: 1)
+        True
+    """
+    if predicate is None:
+        return True
+    if callable(predicate):
+        predicate = predicate()
+    return bool(predicate)
+
+
+###############################################################################
+# Instruction merging
+###############################################################################
+
+# Merge functions by (left instruction class, right instruction class).
+merges = dict()
+
+# Merge functions resolved for concrete instruction classes.
+_resolved_merges = dict()
+
+
+def register_merge(left, right, func):
+    """Register function merging instructions of classes left and right.
+
+    ``func`` gets called with both instructions and returns the merged
+    instruction or raises ``PlumbingCollision``. Merge functions registered
+    for base classes apply to subclasses, unless more specific merge
+    functions are registered.
+    """
+    merges[(left, right)] = func
+    _resolved_merges.clear()
+
+
+def unregister_merge(left, right):
+    """Unregister function merging instructions of classes left and right."""
+    del merges[(left, right)]
+    _resolved_merges.clear()
+
+
+def lookup_merge(left, right):
+    """Lookup merge function for instruction classes left and right."""
+    key = (left, right)
+    try:
+        return _resolved_merges[key]
+    except KeyError:
+        pass
+    func = None
+    for left_base in left.__mro__:
+        for right_base in right.__mro__:
+            func = merges.get((left_base, right_base))
+            if func is not None:
+                break
+        if func is not None:
+            break
+    _resolved_merges[key] = func
+    return func
+
+
+def merge(left, right):
+    """Merge two instructions for the same attribute.
+
+    Equal instructions merge to left. Instructions without registered merge
+    function collide.
+
+    .. code-block:: pycon
+
+        >>> from plumber.instructions import default
+        >>> from plumber.instructions import merge
+        >>> from plumber.instructions import override
+
+        >>> merge(default(1), override(2))
+        <override 'None' of None payload=2>
+
+        >>> merge(default(1), Instruction(2))
+        Traceback (most recent call last):
+          ...
+        plumber.exceptions.PlumbingCollision:
+            <default 'None' of None payload=1>
+          with:
+            <Instruction 'None' of None payload=2>
+    """
+    func = lookup_merge(left.__class__, right.__class__)
+    if func is None:
+        raise PlumbingCollision(left, right)
+    if left == right:
+        return left
+    return func(left, right)
+
+
+def keep_left(left, right):
+    return left
+
+
+def keep_right(left, right):
+    return right
+
+
+def collide(left, right):
+    raise PlumbingCollision(left, right)
+
+
 class Instruction(object):
     """Base class for all plumbing instructions.
 
@@ -117,6 +239,7 @@ class Instruction(object):
     __name__ = None
     __parent__ = None
     __stage__ = None
+    __predicate__ = None
 
     def __init__(self, item, name=None):
         """Create instruction.
@@ -193,6 +316,11 @@ class Instruction(object):
     def payload(self):
         return payload(self)
 
+    @property
+    def enabled(self):
+        """Whether the instruction is used, evaluated at class creation."""
+        return evaluate(self.__predicate__)
+
     def __repr__(self):
         return "<%(cls)s '%(name)s' of %(parent)s payload=%(payload)s>" % dict(
             cls=self.__class__.__name__,
@@ -282,15 +410,7 @@ class default(Stage1Instruction):
                 <Instruction 'None' of None payload='foo'>
 
         """
-        if self == right:
-            return self
-        if isinstance(right, default):
-            return self
-        if isinstance(right, override):
-            return right
-        if isinstance(right, finalize):
-            return right
-        raise PlumbingCollision(self, right)
+        return merge(self, right)
 
     def __call__(self, dct, derived_members):
         name = self.name
@@ -347,15 +467,7 @@ class override(Stage1Instruction):
                 <Instruction 'None' of None payload=1>
 
         """
-        if self == right:
-            return self
-        if isinstance(right, default):
-            return self
-        if isinstance(right, override):
-            return self
-        if isinstance(right, finalize):
-            return right
-        raise PlumbingCollision(self, right)
+        return merge(self, right)
 
     def __call__(self, dct, derived_members):
         if self.name in dct:
@@ -418,13 +530,7 @@ class finalize(Stage1Instruction):
                 <Instruction 'None' of None payload=1>
 
         """
-        if self == right:
-            return self
-        if isinstance(right, default):
-            return self
-        if isinstance(right, override):
-            return self
-        raise PlumbingCollision(self, right)
+        return merge(self, right)
 
     def __call__(self, dct, derived_members):
         if self.name in dct:
@@ -432,20 +538,260 @@ class finalize(Stage1Instruction):
         dct[self.name] = self.payload
 
 
+register_merge(default, default, keep_left)
+register_merge(default, override, keep_right)
+register_merge(default, finalize, keep_right)
+register_merge(override, default, keep_left)
+register_merge(override, override, keep_left)
+register_merge(override, finalize, keep_right)
+register_merge(finalize, default, keep_left)
+register_merge(finalize, override, keep_left)
+register_merge(finalize, finalize, collide)
+
+
+_missing = object()
+
+
+class computed(object):
+    """Lazily computed class attribute.
+
+    Wraps a factory without arguments, used as payload of stage 1
+    instructions. The value is computed thread-safe on first access and then
+    replaces the descriptor on the class.
+
+    .. code-block:: pycon
+
+        >>> from plumber.instructions import computed
+
+        >>> class Foo(object):
+        ...     table = computed(lambda: dict(a=1))
+
+        >>> Foo.table
+        {'a': 1}
+
+        >>> Foo.__dict__['table']
+        {'a': 1}
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.__doc__ = factory.__doc__
+        self.name = getattr(factory, '__name__', None)
+        self.value = _missing
+        self.lock = threading.Lock()
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, cls=None):
+        if self.value is _missing:
+            with self.lock:
+                if self.value is _missing:
+                    self.value = self.factory()
+        if cls is None:
+            cls = type(obj)
+        # Replace the descriptor on the class declaring it.
+        for base in cls.__mro__:
+            if base.__dict__.get(self.name) is self:
+                setattr(base, self.name, self.value)
+                break
+        return self.value
+
+    def __repr__(self):
+        return '<computed %s>' % self.name
+
+
+def containerkind(value):
+    """Immutable type containers of value's type merge into, or ``None``."""
+    if isinstance(value, (tuple, list)):
+        return tuple
+    if isinstance(value, (set, frozenset)):
+        return frozenset
+    if isinstance(value, (dict, types.MappingProxyType)):
+        return dict
+    return None
+
+
+def extended(left, right, override=False):
+    """Merge container right into container left.
+
+    Sequences are concatenated dropping duplicate items, sets are united and
+    dicts updated. Returns an immutable container, or
+    ``_missing`` if the containers are of different kind or dicts map a key
+    to different values. With ``override``, keys of left can be mapped to
+    other values by right.
+    """
+    kind = containerkind(left)
+    if kind is None or kind is not containerkind(right):
+        return _missing
+    if kind is frozenset:
+        return frozenset(left) | frozenset(right)
+    if kind is tuple:
+        merged = list()
+        for item in tuple(left) + tuple(right):
+            if item not in merged:
+                merged.append(item)
+        return tuple(merged)
+    merged = dict(left)
+    for key, value in right.items():
+        if not override and key in merged and merged[key] != value:
+            return _missing
+        merged[key] = value
+    return types.MappingProxyType(merged)
+
+
+class extend(Stage1Instruction):
+    """Extend a container attribute contributed by several behaviors.
+
+    Tuples and lists, sets and frozensets or dicts declared by behaviors are
+    merged in behavior order into a single immutable value when the plumbing
+    class gets created. The value inherited from base classes comes first,
+    followed by the value declared on the plumbing class and the values of
+    the behaviors. Sequences drop duplicate items, dicts mapping a key to
+    different values collide, except keys of the inherited value.
+
+    .. code-block:: pycon
+
+        >>> from plumber.instructions import extend
+
+        >>> extend(('a', 'b')) + extend(['b', 'c'])
+        <extend 'None' of None payload=('a', 'b', 'c')>
+
+        >>> extend(dict(a=1)) + extend(dict(a=2))
+        Traceback (most recent call last):
+          ...
+        plumber.exceptions.PlumbingCollision:
+            <extend 'None' of None payload=mappingproxy({'a': 1})>
+          with:
+            <extend 'None' of None payload=mappingproxy({'a': 2})>
+    """
+
+    def __init__(self, item, name=None):
+        if containerkind(item) is None:
+            raise TypeError('Can not extend %r' % (item,))
+        super(extend, self).__init__(extended(item, item), name=name)
+
+    def __add__(self, right):
+        return merge(self, right)
+
+    def __call__(self, dct, derived_members):
+        name = self.name
+        value = self.payload
+        if name in dct:
+            value = extended(dct[name], value)
+            if value is _missing:
+                raise PlumbingCollision('Plumbing class', self)
+        if name in derived_members:
+            inherited = _missing
+            for base in dct['__plumbing_stacks__'].bases:
+                inherited = getattr(base, name, _missing)
+                if inherited is not _missing:
+                    break
+            if inherited is not _missing:
+                value = extended(inherited, value, override=True)
+                if value is _missing:
+                    raise PlumbingCollision('Plumbing base class', self)
+        dct[name] = value
+
+
+def merge_extend(left, right):
+    merged = extended(left.payload, right.payload)
+    if merged is _missing:
+        raise PlumbingCollision(left, right)
+    instruction = extend(merged, name=left.name)
+    instruction.__parent__ = left.__parent__
+    return instruction
+
+
+register_merge(extend, extend, merge_extend)
+
+
 ###############################################################################
 # Stage2 instructions
 ###############################################################################
 
 
 class Stage2Instruction(Instruction):
-    """Instructions installed in stage2: so far only plumb."""
+    """Instructions installed in stage2.
+
+    Pipeline building instructions merge into an instruction holding all
+    layers, which compiles them into an entrance once the endpoint is known.
+    """
 
     __stage__ = 'stage2'
 
+    # Whether the instruction supports compiling its pipeline before the
+    # plumbing class gets created, see ``precompile``.
+    __precompile__ = False
+
+    # Lock declared via ``synchronized``, acquired at the entrance.
+    __lock__ = None
+
     def __call__(self, cls):
         """cls is the plumbing class, type finished its work already."""
         raise NotImplementedError  # pragma: no cover
 
+    @property
+    def layers(self):
+        """Instructions forming the pipeline, outermost first."""
+        return self.__dict__.get('layers', (self,))
+
+    @layers.setter
+    def layers(self, value):
+        self.__dict__['layers'] = value
+
+    def compile(self, layers, next_):
+        """Compile layers into an entrance, given the endpoint next_."""
+        raise NotImplementedError  # pragma: no cover
+
+    def fusable(self, layer):
+        """Whether layer of a base class pipeline can be fused."""
+        return False
+
+    def fuse(self, mro, next_):
+        """Fuse layers with the pipeline of a plumbing base class.
+
+        If next_ is the entrance of a pipeline built on a base class, the
+        layers of this pipeline are appended and its endpoint is used instead
+        of wrapping the entrance. ``mro`` are the classes following the
+        plumbing class in its method resolution order.
+        """
+        for base in mro:
+            if self.name not in base.__dict__:
+                continue
+            stacks = base.__dict__.get('__plumbing_stacks__')
+            if stacks is None or stacks.entrances.get(self.name) is not next_:
+                break
+            layers = stacks.layers[self.name]
+            if not all(self.fusable(layer) for layer in layers):
+                break
+            return self.layers + layers, stacks.endpoints[self.name]
+        return self.layers, next_
+
+    def build(self, stacks, mro, next_):
+        """Compile the pipeline, record its components and return entrance."""
+        layers, next_ = self.fuse(mro, next_)
+        entrance = synchronizedfor(layers, self.compile(layers, next_), stacks)
+        stacks.layers[self.name] = layers
+        stacks.entrances[self.name] = entrance
+        stacks.endpoints[self.name] = next_
+        return entrance
+
+    def install(self, cls, next_):
+        """Compile and install the pipeline on the plumbing class."""
+        entrance = self.build(cls.__plumbing_stacks__, cls.__mro__[1:], next_)
+        setattr(cls, self.name, entrance)
+
+    def precompile(self, dct, mro, next_):
+        """Compile the pipeline into the class dict before class creation.
+
+        Called if the endpoint next_ is known before the plumbing class gets
+        created, saves modifying the class afterwards. Returns whether the
+        entrance was added to dct, otherwise the instruction gets called with
+        the plumbing class.
+        """
+        return False
+
 
 def entrancefor(plumbing_method, next_):
     """An entrance for a plumbing method, given next_.
@@ -462,28 +808,251 @@ def entrancefor(plumbing_method, next_):
     return entrance
 
 
-def plumbingfor(plumbing_method, next_):
-    """A plumbing method combining two plumbing methods."""
+def hooksfor(befores, afters, next_):
+    """An entrance calling hooks before and after next_.
+
+    Hooks have the signature of the entrance: (self, *args, **kw), their
+    return values are ignored.
+    """
+    if not afters:
+
+        def entrance(self, *args, **kw):
+            for hook in befores:
+                hook(self, *args, **kw)
+            return next_(self, *args, **kw)
+
+    elif not befores:
+
+        def entrance(self, *args, **kw):
+            result = next_(self, *args, **kw)
+            for hook in afters:
+                hook(self, *args, **kw)
+            return result
+
+    else:
+
+        def entrance(self, *args, **kw):
+            for hook in befores:
+                hook(self, *args, **kw)
+            result = next_(self, *args, **kw)
+            for hook in afters:
+                hook(self, *args, **kw)
+            return result
+
+    doc = next_.__doc__
+    for hook in befores + afters:
+        doc = plumb_str(hook.__doc__, doc)
+    entrance.__doc__ = doc
+    entrance.__name__ = (befores + afters)[0].__name__
+    return entrance
+
 
-    def plumbing(next__, self, *args, **kw):
-        return plumbing_method(entrancefor(next_, next__), self, *args, **kw)
+def chainfor(layers, next_):
+    """Compile plumbing layers into an entrance, given the endpoint next_.
 
-    plumbing.__doc__ = plumb_str(plumbing_method.__doc__, next_.__doc__)
-    plumbing.__name__ = plumbing_method.__name__
-    return plumbing
+    Layers are ``plumb`` instructions ordered from outermost to innermost.
+    Plumbing methods are wrapped by ``entrancefor``, subsequent ``before`` and
+    ``after`` hooks are flattened into one entrance by ``hooksfor``.
+    """
+    befores = []
+    afters = []
+    for layer in reversed(layers):
+        if isinstance(layer, before):
+            befores.insert(0, layer.payload)
+            continue
+        if isinstance(layer, after):
+            afters.append(layer.payload)
+            continue
+        if befores or afters:
+            next_ = hooksfor(befores, afters, next_)
+            befores = []
+            afters = []
+        next_ = entrancefor(layer.payload, next_)
+    if befores or afters:
+        next_ = hooksfor(befores, afters, next_)
+    return next_
+
+
+# Accessors of properties and how the missing ones are named in errors.
+_accessors = (('fget', 'getter'), ('fset', 'setter'), ('fdel', 'deleter'))
+
+
+def unsetfor(name, kind):
+    """An accessor raising ``AttributeError``, used as endpoint of property
+    pipelines if the plumbed property lacks the accessor.
+    """
+
+    def unset(self, *args):
+        raise AttributeError(
+            "property '%s' of '%s' object has no %s" % (name, type(self).__name__, kind)
+        )
+
+    return unset
+
+
+def propertyfor(layers, next_, name):
+    """Compile plumbing properties into a property, given the endpoint next_.
+
+    Each accessor is compiled into its own chain of entrances from the
+    accessors the layers provide. Layers lacking an accessor are skipped, an
+    accessor wrapped by ``override`` replaces the accessors of subsequent
+    layers and of next_.
+    """
+    accessors = []
+    for accessor, kind in _accessors:
+        funcs = []
+        endpoint = getattr(next_, accessor)
+        for layer in layers:
+            func = getattr(layer.payload, accessor)
+            if func is None:
+                continue
+            if type(func) is override:
+                endpoint = func.payload
+                break
+            funcs.append(func)
+        if funcs and endpoint is None:
+            endpoint = unsetfor(name, kind)
+        for func in reversed(funcs):
+            endpoint = entrancefor(func, endpoint)
+        accessors.append(endpoint)
+    doc = next_.__doc__
+    for layer in reversed(layers):
+        doc = plumb_str(layer.payload.__doc__, doc)
+    return next_.__class__(*accessors, doc)
+
+
+# Named locks shared by all plumbing classes and the lock guarding creation
+# of locks.
+_locks = dict()
+_locks_lock = threading.Lock()
+
+# Locks of instances by id of the instance and whether they are reentrant,
+# along with a weak reference to the instance. Locks are kept outside of
+# the instances, thus copies and pickles of instances get locks of their own.
+_instance_locks = dict()
+
+
+def lockof(obj, reentrant=True):
+    """Lock of instance ``obj`` used by synchronized pipelines or ``None``."""
+    entry = _instance_locks.get((id(obj), reentrant))
+    if entry is not None and entry[0]() is obj:
+        return entry[1]
+    return None
+
+
+def check_lockable(cls):
+    """Check that instances of plumbing class ``cls`` can be locked if
+    pipelines are synchronized by instance.
+    """
+    if cls.__weakrefoffset__:
+        return
+    for layers in cls.__plumbing_stacks__.layers.values():
+        for layer in layers:
+            if layer.__lock__ is not None and layer.__lock__[0] == 'instance':
+                raise TypeError(
+                    'Pipeline %s of %s is synchronized by instance, instances '
+                    'must support weak references, add __weakref__ to '
+                    '__slots__' % (layer.__name__, cls.__qualname__)
+                )
+
+
+def lockfor(spec, stacks):
+    """The lock for ``spec`` or a function returning the lock of an instance."""
+    lock, reentrant = spec
+    factory = threading.RLock if reentrant else threading.Lock
+    if lock == 'instance':
+
+        def instancelock(self):
+            key = (id(self), reentrant)
+            entry = _instance_locks.get(key)
+            if entry is not None and entry[0]() is self:
+                return entry[1]
+            with _locks_lock:
+                entry = _instance_locks.get(key)
+                if entry is None or entry[0]() is not self:
+
+                    def discard(ref):
+                        if _instance_locks.get(key, (None,))[0] is ref:
+                            del _instance_locks[key]
+
+                    entry = _instance_locks[key] = (
+                        weakref.ref(self, discard),
+                        factory(),
+                    )
+            return entry[1]
+
+        return instancelock
+    locks = stacks.locks if lock == 'class' else _locks
+    with _locks_lock:
+        if lock not in locks:
+            locks[lock] = (reentrant, factory())
+        if locks[lock][0] != reentrant:
+            raise ValueError('Lock %s is used reentrant and not reentrant' % lock)
+        return locks[lock][1]
+
+
+def synchronizedfor(layers, entrance, stacks):
+    """Wrap entrance acquiring the lock declared by layers, if any."""
+    declaring = None
+    for layer in layers:
+        if layer.__lock__ is None:
+            continue
+        if declaring is None:
+            declaring = layer
+        elif layer.__lock__ != declaring.__lock__:
+            raise PlumbingCollision(declaring, layer)
+    if declaring is None:
+        return entrance
+    lock = lockfor(declaring.__lock__, stacks)
+    if isinstance(entrance, property):
+        accessors = [
+            lockedfor(lock, getattr(entrance, attr))
+            if getattr(entrance, attr) is not None
+            else None
+            for attr, _ in _accessors
+        ]
+        return entrance.__class__(*accessors, entrance.__doc__)
+    return lockedfor(lock, entrance)
+
+
+def lockedfor(lock, next_):
+    """An entrance calling next_ while holding lock.
+
+    ``lock`` is either a lock or a function returning the lock of an
+    instance.
+    """
+    if inspect.iscoroutinefunction(next_):
+        raise TypeError('Coroutine functions can not be synchronized')
+    if hasattr(lock, 'acquire'):
+
+        def entrance(self, *args, **kw):
+            with lock:
+                return next_(self, *args, **kw)
+
+    else:
+        instancelock = lock
+
+        def entrance(self, *args, **kw):
+            with instancelock(self):
+                return next_(self, *args, **kw)
+
+    entrance.__doc__ = next_.__doc__
+    entrance.__name__ = getattr(next_, '__name__', 'entrance')
+    return entrance
 
 
 class plumb(Stage2Instruction):
     """Plumbing of strings, methods and properties.
 
-    XXX: support getter, setter, deleter to enable:
+    Plumbed properties support declaring accessors via ``getter``, ``setter``
+    and ``deleter``:
 
         @plumb
         @property
-        def foo
+        def foo(next_, self):
 
         @foo.setter
-        def foo
+        def foo(next_, self, value):
     """
 
     def __add__(self, right):
@@ -514,15 +1083,7 @@ class plumb(Stage2Instruction):
                 <plumb 'None' of None payload=<property object at 0x...>>
 
         """
-        if self == right:
-            return self
-        if not isinstance(right, plumb):
-            raise PlumbingCollision(self, right)
-        if not self.ok(self.payload, right.payload):
-            raise PlumbingCollision(self, right)
-        return plumb(
-            self.plumb(plumbingfor, self.payload, right.payload), name=self.name
-        )
+        return merge(self, right)
 
     def ok(self, p1, p2):
         """Check whether we can merge two payloads.
@@ -545,36 +1106,110 @@ class plumb(Stage2Instruction):
             return callable(p2)
         return False
 
-    def plumb(self, plbfunc, p1, p2):
-        if isinstance(p1, str):
-            return plumb_str(p1, p2)
-        if isinstance(p1, property):
-            # XXX: This should be split up into instructions during part
-            # parsing to enable two stages and all instructions
-            propfuncs = []
-            for x in 'fget', 'fset', 'fdel':
-                p1func = getattr(p1, x)
-                p2func = getattr(p2, x)
-                if p2func is None:
-                    propfuncs.append(p1func)
-                elif type(p2func) is override:
-                    propfuncs.append(p2func.payload)
-                else:
-                    propfuncs.append(plbfunc(p1func, p2func))
-            propfuncs.append(plumb_str(p1.__doc__, p2.__doc__))
-            return p1.__class__(*propfuncs)
-        if callable(p1):
-            return plbfunc(p1, p2)
-        # Should never happen
-        raise RuntimeError('Unknown plumbing case.')  # pragma: no cover
+    def getter(self, func):
+        return self.accessor('getter', func)
+
+    def setter(self, func):
+        return self.accessor('setter', func)
+
+    def deleter(self, func):
+        return self.accessor('deleter', func)
+
+    def accessor(self, kind, func):
+        """Copy of this instruction with an accessor added to the property."""
+        if not isinstance(self.payload, property):
+            raise TypeError('Only plumbed properties provide a %s' % kind)
+        instruction = self.__class__(getattr(self.payload, kind)(func))
+        for attr in ('__predicate__', '__lock__'):
+            if attr in self.__dict__:
+                setattr(instruction, attr, self.__dict__[attr])
+        return instruction
 
     def __call__(self, cls):
         # Check for a method on the plumbing class itself.
         next_ = getattr(cls, self.name)
         if not self.ok(self.payload, next_):
             raise PlumbingCollision(self, cls)
-        entrance = self.plumb(entrancefor, self.payload, next_)
-        setattr(cls, self.name, entrance)
+        if isinstance(self.payload, str):
+            cls.__plumbing_stacks__.endpoints[self.name] = next_
+            setattr(cls, self.name, plumb_str(self.payload, next_))
+        else:
+            self.install(cls, next_)
+
+    __precompile__ = True
+
+    def precompile(self, dct, mro, next_):
+        if isinstance(self.payload, str):
+            return False
+        if next_ is None or not self.ok(self.payload, next_):
+            return False
+        dct[self.name] = self.build(dct['__plumbing_stacks__'], mro, next_)
+        return True
+
+    def compile(self, layers, next_):
+        if isinstance(self.payload, property):
+            return propertyfor(layers, next_, self.name)
+        return chainfor(layers, next_)
+
+    def fusable(self, layer):
+        return isinstance(layer, plumb) and not isinstance(layer, plumbtype)
+
+
+def when(predicate):
+    """Decorator making an instruction conditional.
+
+    ``predicate`` is either a value or a callable without arguments. It gets
+    evaluated when a plumbing class is created. If false, the instruction is
+    ignored.
+    """
+
+    def decorator(instruction):
+        instruction.__predicate__ = predicate
+        return instruction
+
+    return decorator
+
+
+def synchronized(lock='instance', reentrant=True):
+    """Decorator declaring that a pipeline needs mutual exclusion.
+
+    The lock is acquired once at the entrance of the pipeline, the layers
+    get called while holding it. ``lock`` is either ``instance`` for a lock
+    per instance, ``class`` for a lock per plumbing class or the name of a
+    lock shared by all plumbing classes. All synchronized pipelines using the
+    same lock exclude each other. ``reentrant`` selects ``threading.RLock``
+    or ``threading.Lock``.
+    """
+
+    def decorator(instruction):
+        if not isinstance(instruction, Stage2Instruction):
+            raise TypeError('Only pipeline instructions can be synchronized')
+        instruction.__lock__ = (lock, reentrant)
+        return instruction
+
+    return decorator
+
+
+def plumbif(predicate):
+    """Decorator for plumbing methods only plumbed if ``predicate`` is true
+    at plumbing class creation time.
+    """
+    return lambda item: when(predicate)(plumb(item))
+
+
+def merge_plumb(left, right):
+    if not left.ok(left.payload, right.payload):
+        raise PlumbingCollision(left, right)
+    if isinstance(left.payload, str):
+        return plumb(plumb_str(left.payload, right.payload), name=left.name)
+    # Plumbing methods and properties are compiled into chains once the
+    # endpoint is known, see ``chainfor`` and ``propertyfor``.
+    merged = plumb(left.payload, name=left.name)
+    merged.layers = left.layers + right.layers
+    return merged
+
+
+register_merge(plumb, plumb, merge_plumb)
 
 
 class plumbifexists(plumb):
@@ -587,6 +1222,510 @@ class plumbifexists(plumb):
             pass
 
 
+class Hook(plumb):
+    """Base class for ``before`` and ``after`` hooks.
+
+    Hooks are pipeline elements not receiving ``next_``, they are called with
+    the arguments of the entrance: ``def foo(self, *args, **kw)``.
+    """
+
+    def ok(self, p1, p2):
+        """Hooks can only be plumbed to methods.
+
+        .. code-block:: pycon
+
+            >>> from plumber import before
+
+            >>> before(property(lambda x: None)) + plumb(1)
+            Traceback (most recent call last):
+              ...
+            plumber.exceptions.PlumbingCollision:
+                <before 'None' of None payload=<property object at 0x...>>
+              with:
+                <plumb 'None' of None payload=1>
+        """
+        return callable(p1) and callable(p2)
+
+
+class before(Hook):
+    """Call hook before the rest of the pipeline."""
+
+
+class after(Hook):
+    """Call hook after the rest of the pipeline returned."""
+
+
+class plumbtype(plumb):
+    """Plumbing methods dispatched by the type of the first argument.
+
+    Methods are registered for types via ``plumbtype.of`` and ``register``,
+    like with ``functools.singledispatchmethod``. Per type of the first
+    argument a chain is compiled, consisting of the methods registered for
+    the type or its bases and of all other plumbing layers. Behaviors not
+    handling the type are skipped. Chains are cached by type. The chain is
+    chosen once per call, by the type of the argument passed to the entrance.
+    The argument may be passed by the keyword named by the signature of the
+    plumbing method, without argument the chain for ``object`` is called.
+    """
+
+    def __init__(self, item, name=None, types=(object,)):
+        super(plumbtype, self).__init__(item, name=name)
+        self.registry = dict.fromkeys(types, payload(item))
+
+    @classmethod
+    def of(cls, *types):
+        """Decorator declaring a plumbing method for ``types``."""
+        return lambda item: cls(item, types=types)
+
+    def register(self, *types):
+        """Decorator registering a plumbing method for further ``types``."""
+
+        def decorator(func):
+            self.registry.update(dict.fromkeys(types, func))
+            return func
+
+        return decorator
+
+    def dispatch(self, cls):
+        """Plumbing method for type ``cls`` or ``None``."""
+        for base in cls.__mro__:
+            func = self.registry.get(base)
+            if func is not None:
+                return func
+        return None
+
+    def __eq__(self, right):
+        if not super(plumbtype, self).__eq__(right):
+            return False
+        return self.registry == right.registry
+
+    def fusable(self, layer):
+        return isinstance(layer, plumb)
+
+    def compile(self, layers, next_):
+        chains = dict()
+
+        def chainfortype(cls):
+            typed = []
+            for layer in layers:
+                if isinstance(layer, plumbtype):
+                    func = layer.dispatch(cls)
+                    if func is None:
+                        continue
+                    layer = plumb(func)
+                typed.append(layer)
+            return chainfor(typed, next_)
+
+        # The first argument may be passed by keyword.
+        code = getattr(self.payload, '__code__', None)
+        argname = None
+        if code is not None and code.co_argcount > 2:
+            argname = code.co_varnames[2]
+
+        def entrance(self, *args, **kw):
+            if args:
+                cls = type(args[0])
+            elif argname in kw:
+                cls = type(kw[argname])
+            else:
+                cls = object
+            chain = chains.get(cls)
+            if chain is None:
+                chain = chains[cls] = chainfortype(cls)
+            return chain(self, *args, **kw)
+
+        doc = next_.__doc__
+        for layer in reversed(layers):
+            doc = plumb_str(layer.payload.__doc__, doc)
+        entrance.__doc__ = doc
+        entrance.__name__ = self.name
+        return entrance
+
+
+def merge_plumbtype(left, right):
+    if not left.ok(left.payload, right.payload):
+        raise PlumbingCollision(left, right)
+    merged = plumbtype(left.payload, name=left.name)
+    merged.layers = left.layers + right.layers
+    return merged
+
+
+register_merge(plumbtype, plumbtype, merge_plumbtype)
+register_merge(plumbtype, plumb, merge_plumbtype)
+register_merge(plumb, plumbtype, merge_plumbtype)
+
+
+def itemsfor(next_):
+    """A batch endpoint calling the scalar endpoint next_ per item."""
+
+    def entrance(self, items):
+        for args in items:
+            next_(self, *args)
+
+    entrance.__doc__ = next_.__doc__
+    entrance.__name__ = next_.__name__
+    return entrance
+
+
+def batchentrancefor(layer, next_):
+    """A batch entrance for a layer of a scalar pipeline, given the batch
+    entrance next_.
+
+    Hooks are called per item, then the whole batch is passed on. Plumbing
+    methods are called per item with a ``next_`` collecting the arguments it
+    gets called with, the collected batch is passed on once. Calling
+    ``next_`` returns ``None`` within a batch.
+    """
+    func = layer.payload
+    if isinstance(layer, before):
+
+        def entrance(self, items):
+            for args in items:
+                func(self, *args)
+            next_(self, items)
+
+    elif isinstance(layer, after):
+
+        def entrance(self, items):
+            next_(self, items)
+            for args in items:
+                func(self, *args)
+
+    else:
+
+        def entrance(self, items):
+            collected = list()
+
+            def collect_next(self, *args):
+                collected.append(args)
+
+            for args in items:
+                func(collect_next, self, *args)
+            next_(self, collected)
+
+    entrance.__doc__ = plumb_str(func.__doc__, next_.__doc__)
+    entrance.__name__ = func.__name__
+    return entrance
+
+
+class batch(Stage2Instruction):
+    """Batched implementation of a plumbed scalar method.
+
+    The batch method has the signature ``def foo(next_, self, items)``, where
+    items is a sequence of argument tuples for the scalar method. The batch
+    pipeline consists of the layers of the scalar pipeline in behavior order,
+    where behaviors providing a batch implementation process the batch once
+    and all other layers get called per item.
+
+    If the plumbing class has no batch endpoint, the scalar endpoint is called
+    per item.
+    """
+
+    def __init__(self, item, name=None, scalar=None):
+        super(batch, self).__init__(item, name=name)
+        self.scalar = scalar
+
+    @classmethod
+    def of(cls, scalar):
+        """Decorator declaring a batch method for ``scalar``."""
+        return lambda item: cls(item, scalar=scalar)
+
+    def __add__(self, right):
+        """Add batch function to pipeline.
+
+        .. code-block:: pycon
+
+            >>> from plumber.instructions import batch
+
+            >>> batch(len, scalar='foo') + batch(len, scalar='bar')
+            Traceback (most recent call last):
+              ...
+            plumber.exceptions.PlumbingCollision:
+                <batch 'None' of None payload=<built-in function len>>
+              with:
+                <batch 'None' of None payload=<built-in function len>>
+        """
+        return merge(self, right)
+
+    def __eq__(self, right):
+        if not super(batch, self).__eq__(right):
+            return False
+        return self.scalar == right.scalar
+
+    def __call__(self, cls):
+        stacks = cls.__plumbing_stacks__
+        scalar = stacks.stage2.get(self.scalar)
+        scalar_layers = getattr(scalar, 'layers', ())
+        next_ = getattr(cls, self.name, None)
+        if next_ is None:
+            scalar_next = stacks.endpoints.get(self.scalar)
+            if scalar_next is None:
+                scalar_next = getattr(cls, self.scalar)
+            next_ = itemsfor(scalar_next)
+            # Scalar endpoint may be the endpoint of a fused pipeline.
+            scalar_layers = stacks.layers.get(self.scalar, scalar_layers)
+        # Behaviors providing a batch implementation replace their scalar
+        # layers, layers are ordered by behavior order.
+        batched = set(layer.__parent__ for layer in self.layers)
+        layers = list(self.layers)
+        if isinstance(scalar, plumb):
+            layers += [
+                layer for layer in scalar_layers if layer.__parent__ not in batched
+            ]
+        layers.sort(key=lambda layer: self.position(cls.__plumbing__, layer))
+        # Record the pipeline, suspending behaviors compiles variants of it.
+        # Locks of scalar layers are acquired at the batch entrance.
+        layers = tuple(layers)
+        entrance = synchronizedfor(layers, self.compile(layers, next_), stacks)
+        stacks.layers[self.name] = layers
+        stacks.entrances[self.name] = entrance
+        stacks.endpoints[self.name] = next_
+        setattr(cls, self.name, entrance)
+
+    def compile(self, layers, next_):
+        for layer in reversed(layers):
+            if isinstance(layer, batch):
+                next_ = entrancefor(layer.payload, next_)
+            else:
+                next_ = batchentrancefor(layer, next_)
+        return next_
+
+    def position(self, behaviors, layer):
+        for index, behavior in enumerate(behaviors):
+            if layer.__parent__ is not None and issubclass(behavior, layer.__parent__):
+                return index
+        return len(behaviors)
+
+
+def merge_batch(left, right):
+    if left.scalar != right.scalar:
+        raise PlumbingCollision(left, right)
+    merged = batch(left.payload, name=left.name, scalar=left.scalar)
+    merged.layers = left.layers + right.layers
+    return merged
+
+
+register_merge(batch, batch, merge_batch)
+
+
+class Dispatch(Stage2Instruction):
+    """Base class for dispatch instructions.
+
+    Dispatch methods do not receive ``next_``, they have the signature of the
+    entrance: ``def foo(self, *args, **kw)``. The methods of all behaviors and
+    the endpoint, if one exists, are called in a single loop in behavior
+    order.
+    """
+
+    def __call__(self, cls):
+        self.install(cls, getattr(cls, self.name, None))
+
+    __precompile__ = True
+
+    def precompile(self, dct, mro, next_):
+        dct[self.name] = self.build(dct['__plumbing_stacks__'], mro, next_)
+        return True
+
+    def fusable(self, layer):
+        return layer.__class__ is self.__class__
+
+    def compile(self, layers, next_):
+        funcs = tuple(layer.payload for layer in layers)
+        if next_ is not None:
+            funcs += (next_,)
+        entrance = self.loop(funcs)
+        doc = None
+        for func in reversed(funcs):
+            doc = plumb_str(func.__doc__, doc)
+        entrance.__doc__ = doc
+        entrance.__name__ = self.name
+        return entrance
+
+    def loop(self, funcs):
+        """Create the entrance looping over funcs."""
+        raise NotImplementedError  # pragma: no cover
+
+
+class first(Dispatch):
+    """Return the first result which is not ``None``.
+
+    Following methods are not called any more.
+    """
+
+    def loop(self, funcs):
+        def entrance(self, *args, **kw):
+            for func in funcs:
+                result = func(self, *args, **kw)
+                if result is not None:
+                    return result
+
+        return entrance
+
+
+class collect(Dispatch):
+    """Return a list with the results of all methods."""
+
+    def loop(self, funcs):
+        def entrance(self, *args, **kw):
+            return [func(self, *args, **kw) for func in funcs]
+
+        return entrance
+
+
+class collectdict(Dispatch):
+    """Return a dict merged from the results of all methods.
+
+    Earlier methods take precedence, ``None`` results are ignored.
+    """
+
+    def loop(self, funcs):
+        funcs = tuple(reversed(funcs))
+
+        def entrance(self, *args, **kw):
+            merged = dict()
+            for func in funcs:
+                result = func(self, *args, **kw)
+                if result is not None:
+                    merged.update(result)
+            return merged
+
+        return entrance
+
+
+class fanout(Dispatch):
+    """Call the methods of all behaviors and the endpoint concurrently.
+
+    Regular functions run on a shared thread pool, the first one in the
+    calling thread. Coroutine functions are awaited concurrently via
+    ``asyncio.gather``. The results are passed in behavior order to the
+    reducer declared via ``fanout.reduce``, by default the list of results is
+    returned. If methods fail, a ``FanoutError`` containing all errors is
+    raised once all methods finished.
+    """
+
+    # Executor running regular functions, created on first use.
+    executor = None
+    executor_lock = threading.Lock()
+
+    def __init__(self, item, name=None, reducer=None):
+        super(fanout, self).__init__(item, name=name)
+        self.reducer = reducer
+
+    @classmethod
+    def reduce(cls, reducer):
+        """Decorator declaring a fanout method with ``reducer``."""
+        return lambda item: cls(item, reducer=reducer)
+
+    @classmethod
+    def pool(cls):
+        """The executor running regular functions."""
+        if fanout.executor is None:
+            with fanout.executor_lock:
+                if fanout.executor is None:
+                    fanout.executor = ThreadPoolExecutor(
+                        thread_name_prefix='plumber-fanout'
+                    )
+        return fanout.executor
+
+    def __add__(self, right):
+        return merge(self, right)
+
+    def __eq__(self, right):
+        if not super(fanout, self).__eq__(right):
+            return False
+        return self.reducer == right.reducer
+
+    def fusable(self, layer):
+        return super(fanout, self).fusable(layer) and layer.reducer == self.reducer
+
+    def loop(self, funcs):
+        coroutines = [inspect.iscoroutinefunction(func) for func in funcs]
+        if not any(coroutines):
+            return self.spread(funcs)
+        if not all(coroutines):
+            raise TypeError(
+                'Fanout %s mixes coroutine functions and regular functions' % self.name
+            )
+        return self.gather(funcs)
+
+    def spread(self, funcs):
+        """Entrance running regular functions on the thread pool."""
+        name = self.name
+        reducer = self.reducer
+        head, tail = funcs[0], funcs[1:]
+
+        def entrance(self, *args, **kw):
+            pool = fanout.pool()
+            futures = [
+                pool.submit(contextvars.copy_context().run, func, self, *args, **kw)
+                for func in tail
+            ]
+            results = []
+            errors = []
+            try:
+                results.append(head(self, *args, **kw))
+            except Exception as e:
+                errors.append(e)
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+            return fanoutresult(name, reducer, results, errors)
+
+        return entrance
+
+    def gather(self, funcs):
+        """Entrance awaiting coroutine functions concurrently."""
+        name = self.name
+        reducer = self.reducer
+
+        async def entrance(self, *args, **kw):
+            results = []
+            errors = []
+            for result in await asyncio.gather(
+                *[func(self, *args, **kw) for func in funcs], return_exceptions=True
+            ):
+                if isinstance(result, Exception):
+                    errors.append(result)
+                elif isinstance(result, BaseException):
+                    raise result
+                else:
+                    results.append(result)
+            return fanoutresult(name, reducer, results, errors)
+
+        return entrance
+
+
+def fanoutresult(name, reducer, results, errors):
+    """Reduce the results of a fanout or raise its errors."""
+    if errors:
+        raise FanoutError(name, errors)
+    if reducer is None:
+        return results
+    return reducer(results)
+
+
+def merge_layers(left, right):
+    merged = left.__class__(left.payload, name=left.name)
+    merged.layers = left.layers + right.layers
+    return merged
+
+
+def merge_fanout(left, right):
+    if left.reducer != right.reducer:
+        raise PlumbingCollision(left, right)
+    merged = fanout(left.payload, name=left.name, reducer=left.reducer)
+    merged.layers = left.layers + right.layers
+    return merged
+
+
+register_merge(first, first, merge_layers)
+register_merge(collect, collect, merge_layers)
+register_merge(collectdict, collectdict, merge_layers)
+register_merge(fanout, fanout, merge_fanout)
+
+
 if ZOPE_INTERFACE_AVAILABLE:
 
     class _implements(Stage2Instruction):
@@ -634,12 +1773,7 @@ if ZOPE_INTERFACE_AVAILABLE:
         __name__ = '__interfaces__'
 
         def __add__(self, right):
-            if self == right:
-                return self
-            if not isinstance(right, _implements):
-                raise PlumbingCollision(self, right)
-            ifaces = self.payload + right.payload
-            return _implements(ifaces)
+            return merge(self, right)
 
         def __call__(self, cls):
             if self.payload:
@@ -650,3 +1784,8 @@ if ZOPE_INTERFACE_AVAILABLE:
             if type(self.item) is tuple:
                 return tuple(sorted(self.item))
             return tuple(sorted(implementedBy(self.item)))
+
+    def merge_implements(left, right):
+        return _implements(left.payload + right.payload)
+
+    register_merge(_implements, _implements, merge_implements)
@@ -0,0 +1,237 @@
+"""Memory accounting of plumbing artifacts.
+
+Artifacts are everything plumber keeps per plumbing class beyond the
+attributes provided by behaviors: the stacks, entrances and pipeline
+variants compiled from the plumbing methods, composed docstrings, merged
+instructions, ``zope.interface`` specifications and the creation recipe.
+"""
+
+from .plumber import _build_sizes
+from .plumber import key_of
+from .plumber import plumbing_classes
+from sys import getsizeof
+import os
+import types
+
+_package = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+_containers = (list, tuple, dict, set, frozenset)
+
+artifacts = (
+    'stacks',
+    'entrances',
+    'docstrings',
+    'variants',
+    'instructions',
+    'interfaces',
+    'namespace',
+)
+
+
+def generated(obj):
+    """Whether obj is a function created by plumber."""
+    return isinstance(obj, types.FunctionType) and obj.__code__.co_filename.startswith(
+        _package
+    )
+
+
+class Measure(object):
+    """Measure the artifacts of a plumbing class.
+
+    Objects already measured are skipped, a measure shared by several
+    plumbing classes counts shared artifacts once.
+    """
+
+    def __init__(self, seen=None):
+        self.seen = set() if seen is None else seen
+
+    def __call__(self, cls):
+        self.artifacts = dict.fromkeys(artifacts, 0)
+        self.behaviors = dict()
+        stacks = cls.__dict__['__plumbing_stacks__']
+
+        # Behaviors owning plumbing methods.
+        self.owners = dict()
+        for layers in stacks.layers.values():
+            for layer in layers:
+                payload = layer.payload
+                self.owners[id(payload)] = layer.__parent__
+                if isinstance(payload, property):
+                    for func in (payload.fget, payload.fset, payload.fdel):
+                        self.owners[id(func)] = layer.__parent__
+
+        self.measure_stacks(stacks)
+        for name, entrance in stacks.entrances.items():
+            owner = self.owner(stacks.layers.get(name, ()))
+            self.walk(entrance, owner, 'entrances')
+            self.walk(cls.__dict__.get(name), owner, 'entrances')
+        for variant in stacks.variants.values():
+            self.walk(variant, None, 'variants')
+        self.measure_instructions(cls, stacks)
+        self.measure_interfaces(cls)
+        size = 0
+        for name in (
+            '__plumbing__',
+            '__plumbing_namespace__',
+            '__plumbing_behaviors__',
+        ):
+            size += self.sizeof(cls.__dict__.get(name))
+        self.add('namespace', None, size)
+        return dict(
+            total=sum(self.artifacts.values()),
+            build=_build_sizes.get(cls),
+            artifacts=self.artifacts,
+            behaviors=self.behaviors,
+        )
+
+    def add(self, kind, owner, size):
+        self.artifacts[kind] += size
+        key = key_of(owner)
+        self.behaviors[key] = self.behaviors.get(key, 0) + size
+
+    def sizeof(self, obj):
+        """Size of obj unless seen already."""
+        if obj is None or id(obj) in self.seen:
+            return 0
+        self.seen.add(id(obj))
+        return getsizeof(obj)
+
+    def owner(self, values):
+        for value in values:
+            if isinstance(value, _containers[:2]):
+                owner = self.owner(value)
+                if owner is not None:
+                    return owner
+            else:
+                owner = self.owners.get(id(getattr(value, 'payload', value)))
+                if owner is not None:
+                    return owner
+        return None
+
+    def walk(self, value, owner, kind):
+        """Measure generated functions and containers holding them."""
+        if id(value) in self.seen:
+            return
+        if generated(value):
+            self.closure(value, owner, kind)
+        elif isinstance(value, property):
+            self.add(kind, owner, self.sizeof(value))
+            for func in (value.fget, value.fset, value.fdel):
+                self.walk(func, self.owners.get(id(func), owner), kind)
+        elif type(value) in _containers:
+            self.add(kind, owner, self.sizeof(value))
+            items = value.values() if type(value) is dict else value
+            for item in items:
+                self.walk(item, owner, kind)
+
+    def closure(self, func, owner, kind):
+        cells = func.__closure__ or ()
+        captured = []
+        for cell in cells:
+            try:
+                captured.append(cell.cell_contents)
+            except ValueError:
+                pass
+        owner = self.owner(captured) or owner
+        size = self.sizeof(func) + self.sizeof(cells)
+        for cell in cells:
+            size += self.sizeof(cell)
+        if func.__dict__:
+            size += self.sizeof(func.__dict__)
+        self.add(kind, owner, size)
+        # Docstrings composed for the function, not taken from a plumbing
+        # method or endpoint.
+        doc = func.__doc__
+        if doc is not None and not any(
+            getattr(value, '__doc__', None) is doc
+            for value in captured
+            if not generated(value)
+        ):
+            self.add('docstrings', owner, self.sizeof(doc))
+        for value in captured:
+            self.walk(value, owner, kind)
+
+    def measure_stacks(self, stacks):
+        size = self.sizeof(stacks) + self.sizeof(stacks.__dict__)
+        for container in vars(stacks).values():
+            size += self.sizeof(container)
+        for layers in stacks.layers.values():
+            size += self.sizeof(layers)
+        self.add('stacks', None, size)
+
+    def measure_instructions(self, cls, stacks):
+        """Measure instructions created by merging, behaviors share the
+        instructions they declare.
+        """
+        declared = set()
+        for behavior in cls.__dict__.get('__plumbing_behaviors__', ()):
+            declared.update(id(value) for value in vars(behavior).values())
+        for instruction in list(stacks.stage1.values()) + list(stacks.stage2.values()):
+            if id(instruction) in declared:
+                continue
+            size = self.sizeof(instruction) + self.sizeof(instruction.__dict__)
+            size += self.sizeof(instruction.__dict__.get('layers'))
+            self.add('instructions', instruction.__parent__, size)
+
+    def measure_interfaces(self, cls):
+        """Measure ``zope.interface`` specifications created for cls."""
+        size = 0
+        for name in ('__implemented__', '__provides__'):
+            spec = cls.__dict__.get(name)
+            if spec is None or getattr(spec, 'inherit', cls) is not cls:
+                continue
+            size += self.sizeof(spec)
+            dct = getattr(spec, '__dict__', None)
+            if dct is not None:
+                size += self.sizeof(dct)
+                for value in dct.values():
+                    if type(value) in _containers:
+                        size += self.sizeof(value)
+        self.add('interfaces', None, size)
+
+
+def memory_report(target=None, summary=False):
+    """Memory retained by plumbing artifacts, in bytes.
+
+    ``target`` is a plumbing class or a module, by default all plumbing
+    classes of the process are reported. Returns a dict by
+    ``module:qualname`` of the plumbing classes, containing the
+    ``total``, the sizes by kind of artifact in ``artifacts``, the sizes
+    by ``module:qualname`` of the behaviors owning them in ``behaviors``
+    and the bytes allocated while creating the class in ``build``, if
+    ``tracemalloc`` was tracing at that time, otherwise ``None``. With
+    ``summary``, the reports of all classes are summed up.
+    """
+    if isinstance(target, type):
+        classes = {target} if '__plumbing_stacks__' in target.__dict__ else set()
+    else:
+        classes = plumbing_classes()
+        if target is not None:
+            classes = {cls for cls in classes if cls.__module__ == target.__name__}
+    return report(classes, summary=summary)
+
+
+def report(classes, summary=False):
+    """Memory used by plumbing artifacts of classes, see ``memory_report``."""
+    measure = Measure()
+    reports = dict()
+    for cls in sorted(classes, key=key_of):
+        reports[key_of(cls)] = measure(cls)
+    if not summary:
+        return reports
+    totals = dict(
+        classes=len(reports),
+        total=0,
+        build=None,
+        artifacts=dict.fromkeys(artifacts, 0),
+        behaviors=dict(),
+    )
+    for item in reports.values():
+        totals['total'] += item['total']
+        if item['build'] is not None:
+            totals['build'] = (totals['build'] or 0) + item['build']
+        for kind, size in item['artifacts'].items():
+            totals['artifacts'][kind] += size
+        for behavior, size in item['behaviors'].items():
+            totals['behaviors'][behavior] = totals['behaviors'].get(behavior, 0) + size
+    return totals
@@ -1,4 +1,20 @@
+from .behavior import Conditional
 from .behavior import Instructions
+from .behavior import behaviormetaclass
+from .behavior import resolve
+from .instructions import _accessors
+from .instructions import check_lockable
+from .instructions import merge
+from .instructions import synchronizedfor
+from .instructions import unsetfor
+import contextlib
+import contextvars
+import copyreg
+import sys
+import threading
+import tracemalloc
+import types
+import weakref
 
 
 class Stacks(object):
@@ -9,6 +25,13 @@ class Stacks(object):
         self.history = list()
         self.stage1 = dict()
         self.stage2 = dict()
+        self.endpoints = dict()
+        self.layers = dict()
+        self.entrances = dict()
+        self.variants = dict()
+        self.locks = dict()
+        # Bases of the plumbing class, known to stage 1 instructions.
+        self.bases = ()
 
 
 class plumber(type):
@@ -49,64 +72,552 @@ class plumber(type):
         # Parse the behaviors.
         for behavior in plb:
             for instruction in Instructions(behavior):
+                # disabled conditional instructions are ignored
+                if not instruction.enabled:
+                    continue
                 # already seen instruction are ignored
                 if instruction not in history:
                     stage = getattr(stacks, instruction.__stage__)
                     instruction_name = instruction.__name__
                     prev_instruction = stage.get(instruction_name)
                     if prev_instruction:
-                        instruction = prev_instruction + instruction
+                        instruction = merge(prev_instruction, instruction)
                     stage[instruction_name] = instruction
                 history.append(instruction)
         return stacks
 
     def __new__(mcls, name, bases, dct):
+        # Remember the original namespace, it is the recipe used to rebuild
+        # the class when pickled by value.
+        dct['__plumbing_namespace__'] = namespace_of(dct)
+
         # No plumbing behaviors. Apply metaclasshooks and return class.
         if '__plumbing__' not in dct:
             cls = super(plumber, mcls).__new__(mcls, name, bases, dct)
             return plumber.apply_metaclasshooks(cls, name, bases, dct)
 
-        # Ensure plumbing behaviors are iterable.
-        plb = dct['__plumbing__']
-        if type(plb) is not tuple:
-            plb = dct['__plumbing__'] = (plb,)
+        # Measure memory allocated while building if tracemalloc is tracing.
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            start = tracemalloc.get_traced_memory()[0]
+
+        # Prepare the class namespace, build the class and finish it.
+        pending = prepare(mcls, name, bases, dct)
+        cls = super(plumber, mcls).__new__(mcls, name, bases, dct)
+        finish(cls, pending)
+        if tracing:
+            _build_sizes[cls] = max(0, tracemalloc.get_traced_memory()[0] - start)
+
+        # Apply metaclasshooks and return class.
+        return plumber.apply_metaclasshooks(cls, name, bases, dct)
+
+
+def namespace_of(dct):
+    """Class body extras as passed to the plumber.
+
+    Everything the plumber or ``type`` computes itself is skipped.
+    """
+    return {
+        key: value
+        for key, value in dct.items()
+        if key not in _namespace_ignores and key != '__plumbing__'
+    }
+
+
+def resolve_behaviors(plb):
+    """Effective behaviors of a plumbing declaration.
+
+    Conditional behaviors are resolved to the behavior if enabled,
+    otherwise they are dropped. Behaviors given as dotted path get
+    imported.
+    """
+    if type(plb) is not tuple:
+        plb = (plb,)
+    resolved = list()
+    for behavior in plb:
+        if isinstance(behavior, Conditional):
+            if not behavior.enabled:
+                continue
+            behavior = behavior.behavior
+        resolved.append(resolve(behavior))
+    return tuple(resolved)
+
+
+def index_behaviors(bases, plb):
+    """Effective behaviors of a plumbing class, including the bases of
+    behaviors and the behaviors of plumbing base classes.
+    """
+    index = set()
+    for base in bases:
+        index.update(getattr(base, '__plumbing_behaviors__', ()))
+    for behavior in plb:
+        index.update(
+            base for base in behavior.__mro__ if isinstance(base, behaviormetaclass)
+        )
+    return frozenset(index)
+
+
+def has_behavior(obj, behavior):
+    """Check whether plumbing class or instance ``obj`` uses ``behavior``.
+
+    Behaviors of plumbing base classes and base classes of behaviors
+    count as used.
+    """
+    cls = obj if isinstance(obj, type) else type(obj)
+    return behavior in getattr(cls, '__plumbing_behaviors__', ())
+
+
+def prepare(mcls, name, bases, dct):
+    """Apply behaviors to the namespace of a plumbing class to be created.
+
+    Returns the stage 2 instructions to be installed on the created class.
+    """
+    # Ensure plumbing behaviors are iterable and resolved.
+    plb = dct['__plumbing__'] = resolve_behaviors(dct['__plumbing__'])
+
+    # Parse behaviors and index them.
+    stacks = plumber.parse_behaviors(plb, dct)
+    stacks.bases = bases
+    dct['__plumbing_behaviors__'] = index_behaviors(bases, plb)
+
+    # Install stage 1.
+    members = plumber.derived_members(bases)
+    for instruction in stacks.stage1.values():
+        instruction(dct, members)
+
+    # Compile stage 2 pipelines with known endpoints into the class dict,
+    # each modification of a created class invalidates its type caches.
+    pending = dict()
+    for attr, instruction in stacks.stage2.items():
+        if not instruction.__precompile__:
+            pending[attr] = instruction
+            continue
+        next_, mro = endpoint_of(mcls, attr, dct, bases)
+        if next_ is _missing or not instruction.precompile(dct, mro, next_):
+            pending[attr] = instruction
+    return pending
+
+
+def finish(cls, pending):
+    """Install remaining stage 2 on the created plumbing class."""
+    for instruction in pending.values():
+        instruction(cls)
+    check_lockable(cls)
+
+    # Track behavior dependencies for replumbing.
+    for behavior in cls.__plumbing__:
+        dependents(behavior).add(cls)
+
+
+def inplace(cls, behaviors):
+    """Apply behaviors to an existing class without building it again.
+
+    The namespace of the class is prepared like the one of a class to be
+    created and changed attributes are set on ``cls``.
+    """
+    original = namespace(cls)
+    dct = dict(original)
+    dct['__plumbing__'] = behaviors
+    dct['__plumbing_namespace__'] = namespace_of(dct)
+    pending = prepare(type(cls), cls.__name__, cls.__bases__, dct)
+    for name in original:
+        if name not in dct:
+            delattr(cls, name)
+    for name, value in dct.items():
+        if original.get(name, _missing) is value:
+            continue
+        setattr(cls, name, value)
+        set_name = getattr(type(value), '__set_name__', None)
+        if set_name is not None:
+            set_name(value, cls, name)
+    finish(cls, pending)
+    return plumber.apply_metaclasshooks(cls, cls.__name__, cls.__bases__, dct)
+
+
+def endpoint_of(mcls, name, dct, bases):
+    """Endpoint of attribute ``name`` on the class about to be created.
+
+    Returns the endpoint and the classes following the plumbing class in
+    its method resolution order, up to the class defining the endpoint.
+    The endpoint is ``None`` if the attribute does not exist. If it can
+    not be determined reliably before the class gets created, i.e. if
+    several bases define it or it is a descriptor bound on lookup,
+    ``_missing`` is returned.
+    """
+    for meta in mcls.__mro__:
+        if hasattr(type(meta.__dict__.get(name)), '__set__'):
+            return _missing, ()
+    owner = endpoint = None
+    for base in bases:
+        for klass in base.__mro__:
+            if name in klass.__dict__:
+                if owner is not None:
+                    return _missing, ()
+                owner = base
+                endpoint = klass.__dict__[name]
+                break
+    if name in dct:
+        endpoint = dct[name]
+    elif owner is None:
+        if hasattr(mcls, name):
+            return _missing, ()
+        return None, ()
+    if not isinstance(endpoint, _unbound) and hasattr(type(endpoint), '__get__'):
+        return _missing, ()
+    return endpoint, owner.__mro__ if owner is not None else ()
+
+
+@contextlib.contextmanager
+def suspended(target, *behaviors):
+    """Suspend behaviors for a plumbing class or instance.
+
+    Within the context, method pipelines of ``target`` skip the layers
+    of ``behaviors``. Suspension is bound to the current context, thus it
+    is local to threads and asyncio tasks. While a suspension is active,
+    dispatching entrances are installed on the plumbing classes in the
+    method resolution order of ``target`` and, if ``target`` is a class,
+    on its plumbing subclasses. They choose a pipeline variant built once
+    per plumbing class and set of suspended behaviors. Suspensions of an
+    instance take precedence over suspensions of its classes.
+    """
+    owners = _plumbings_of(target)
+    key = id(target)
+    state = dict(_suspended.get())
+    state[key] = state.get(key, frozenset()) | frozenset(behaviors)
+    token = _suspended.set(state)
+    for owner in owners:
+        _suspend(owner)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+        for owner in owners:
+            _resume(owner)
+
+
+def dependents(behavior):
+    """Weak set of plumbing classes using ``behavior``.
+
+    Behaviors are identified by module and qualified name, thus a
+    redefined behavior shares the dependents of the behavior it replaces.
+    """
+    key = (behavior.__module__, behavior.__qualname__)
+    dependents = _dependents.get(key)
+    if dependents is None:
+        dependents = _dependents[key] = weakref.WeakSet()
+    return dependents
+
+
+def plumbing_classes():
+    """Plumbing classes of the process, i.e. the dependents of all behaviors."""
+    classes = set()
+    for dependents in _dependents.values():
+        classes.update(dependents)
+    return {cls for cls in classes if '__plumbing_stacks__' in cls.__dict__}
+
+
+def key_of(obj):
+    """Key of a class or behavior by module and qualified name, as used in
+    reports and traces: ``module:qualname``.
+    """
+    if obj is None:
+        return None
+    return '%s:%s' % (obj.__module__, obj.__qualname__)
+
+
+def replumb(behavior):
+    """Rebuild plumbing classes depending on a redefined ``behavior``.
+
+    The behavior replaces the behavior with the same module and qualified
+    name in ``__plumbing__`` of all dependent plumbing classes. Only
+    attributes the old or the new behavior provide instructions for get
+    rebuilt in place, on the dependent classes and their subclasses.
+    """
+    key = (behavior.__module__, behavior.__qualname__)
+    for cls in list(dependents(behavior)):
+        previous = [
+            plb for plb in cls.__plumbing__ if (plb.__module__, plb.__qualname__) == key
+        ]
+        names = set(instr.__name__ for instr in Instructions(behavior))
+        for plb in previous:
+            names.update(instr.__name__ for instr in Instructions(plb))
+        cls.__plumbing__ = tuple(
+            behavior if plb in previous else plb for plb in cls.__plumbing__
+        )
+        rebuild(cls, names)
 
-        # Parse behaviors
-        stacks = plumber.parse_behaviors(plb, dct)
 
-        # Install stage 1.
+def rebuild(cls, names):
+    """Rebuild attributes ``names`` of plumbing class ``cls`` in place.
+
+    Subclasses with plumbings of their own are rebuilt as well, since
+    their pipelines use the entrances of ``cls`` as endpoints.
+    """
+    if '__plumbing_stacks__' in cls.__dict__:
+        dct = dict(cls.__plumbing_namespace__)
+        stacks = plumber.parse_behaviors(cls.__plumbing__, dct)
+        bases = stacks.bases = cls.__bases__
+        cls.__plumbing_behaviors__ = index_behaviors(bases, cls.__plumbing__)
         members = plumber.derived_members(bases)
-        for instruction in stacks.stage1.values():
-            instruction(dct, members)
+        for name, instruction in stacks.stage1.items():
+            if name in names:
+                instruction(dct, members)
+        for name in names:
+            if name in dct:
+                setattr(cls, name, dct[name])
+            elif name == '__doc__':
+                cls.__doc__ = None
+            elif name in cls.__dict__:
+                delattr(cls, name)
+        cls.__plumbing_stacks__ = stacks
+        for name, instruction in stacks.stage2.items():
+            if name in names:
+                instruction(cls)
+        check_lockable(cls)
+    for subclass in cls.__subclasses__():
+        rebuild(subclass, names)
 
-        # Build the class.
-        cls = super(plumber, mcls).__new__(mcls, name, bases, dct)
 
-        # Install stage 2.
-        for instruction in stacks.stage2.values():
-            instruction(cls)
+# Names ignored when remembering the namespace of a plumbing class.
+_namespace_ignores = frozenset(
+    [
+        '__module__',
+        '__qualname__',
+        '__dict__',
+        '__weakref__',
+        '__plumbing_stacks__',
+        '__plumbing_namespace__',
+        '__plumbing_behaviors__',
+    ]
+)
+
+# Plumbing classes by module and qualified name of the behaviors they use.
+_dependents = dict()
+
+# Bytes allocated while creating plumbing classes, recorded if
+# ``tracemalloc`` is tracing at the time.
+_build_sizes = weakref.WeakKeyDictionary()
+
+# Suspended behaviors by id of plumbing class or instance in current context.
+_suspended = contextvars.ContextVar('plumber_suspended', default={})
+
+# Number of active suspensions and replaced attributes by plumbing class.
+_suspensions = dict()
+_suspensions_lock = threading.Lock()
+
+
+def _plumbings_of(target):
+    """Plumbing classes whose pipelines get called for ``target``."""
+    if isinstance(target, type):
+        cls = target
+        subclasses = list(target.__subclasses__())
+    else:
+        cls = type(target)
+        subclasses = []
+    owners = [c for c in cls.__mro__ if '__plumbing_stacks__' in c.__dict__]
+    while subclasses:
+        subclass = subclasses.pop()
+        if '__plumbing_stacks__' in subclass.__dict__ and subclass not in owners:
+            owners.append(subclass)
+        subclasses.extend(subclass.__subclasses__())
+    return owners
+
+
+def _suspended_behaviors(state, obj):
+    """Behaviors suspended for ``obj``, suspensions of the instance take
+    precedence over suspensions of its classes in method resolution order.
+    """
+    behaviors = state.get(id(obj))
+    if behaviors:
+        return behaviors
+    for cls in type(obj).__mro__:
+        behaviors = state.get(id(cls))
+        if behaviors:
+            return behaviors
+    return None
+
+
+def _variant(cls, name, behaviors):
+    """Pipeline ``name`` of ``cls`` without the layers of ``behaviors``."""
+    stacks = cls.__dict__['__plumbing_stacks__']
+    key = (name, behaviors)
+    variant = stacks.variants.get(key)
+    if variant is None:
+        layers = tuple(
+            layer
+            for layer in stacks.layers[name]
+            if layer.__parent__ is None
+            or not any(issubclass(b, layer.__parent__) for b in behaviors)
+        )
+        instruction = stacks.stage2[name]
+        variant = instruction.compile(layers, stacks.endpoints[name])
+        variant = synchronizedfor(layers, variant, stacks)
+        stacks.variants[key] = variant
+    return variant
+
+
+def _dispatcherfor(cls, name, entrance, accessor=None):
+    """An entrance choosing the pipeline variant for suspended behaviors.
+
+    Plumbed properties get a property dispatching each accessor.
+    """
+    if accessor is None and isinstance(entrance, property):
+        accessors = [
+            _dispatcherfor(cls, name, getattr(entrance, attr), (attr, kind))
+            if getattr(entrance, attr) is not None
+            else None
+            for attr, kind in _accessors
+        ]
+        return entrance.__class__(*accessors, entrance.__doc__)
+
+    def dispatch(self, *args, **kw):
+        state = _suspended.get()
+        if state:
+            behaviors = _suspended_behaviors(state, self)
+            if behaviors:
+                variant = _variant(cls, name, behaviors)
+                if accessor is not None:
+                    attr, kind = accessor
+                    variant = getattr(variant, attr) or unsetfor(name, kind)
+                return variant(self, *args, **kw)
+        return entrance(self, *args, **kw)
+
+    dispatch.__doc__ = entrance.__doc__
+    dispatch.__name__ = entrance.__name__
+    return dispatch
 
-        # Apply metaclasshooks and return class.
-        return plumber.apply_metaclasshooks(cls, name, bases, dct)
+
+def _suspend(cls):
+    with _suspensions_lock:
+        count, originals = _suspensions.get(cls, (0, None))
+        if not count:
+            originals = dict()
+            for name in cls.__plumbing_stacks__.layers:
+                originals[name] = cls.__dict__.get(name, _missing)
+                entrance = getattr(cls, name)
+                setattr(cls, name, _dispatcherfor(cls, name, entrance))
+        _suspensions[cls] = (count + 1, originals)
+
+
+def _resume(cls):
+    with _suspensions_lock:
+        count, originals = _suspensions.pop(cls)
+        if count > 1:
+            _suspensions[cls] = (count - 1, originals)
+            return
+        for name, original in originals.items():
+            if original is _missing:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+
+
+_missing = object()
+
+# Attributes returned as is when looked up on a class.
+_unbound = (
+    types.FunctionType,
+    types.WrapperDescriptorType,
+    types.MethodDescriptorType,
+    property,
+)
+
+# Composition cache for plumbing classes rebuilt from a pickled recipe.
+_compositions = weakref.WeakValueDictionary()
+
+
+def _is_importable(cls):
+    """Check whether ``cls`` can be pickled by reference."""
+    obj = sys.modules.get(cls.__module__)
+    for part in cls.__qualname__.split('.'):
+        obj = getattr(obj, part, None)
+    return obj is cls
+
+
+def _composition_key(module, qualname, bases, behaviors, namespace):
+    try:
+        key = (module, qualname, bases, behaviors, frozenset(namespace.items()))
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def rebuild_plumbing(module, qualname, bases, behaviors, namespace):
+    """Rebuild a plumbing class from its recipe.
+
+    Classes are looked up in and stored to the composition cache, thus
+    unpickling many instances of the same class only builds it once.
+    """
+    key = _composition_key(module, qualname, bases, behaviors, namespace)
+    cls = _compositions.get(key) if key is not None else None
+    if cls is not None:
+        return cls
+    dct = dict(namespace)
+    dct['__module__'] = module
+    dct['__qualname__'] = qualname
+    if behaviors is not None:
+        dct['__plumbing__'] = behaviors
+    cls = plumber(qualname.rpartition('.')[2], bases, dct)
+    if key is not None:
+        _compositions[key] = cls
+    return cls
+
+
+def reduce_plumbing(cls):
+    """Reduce a plumbing class for pickling.
+
+    Classes which can be imported are pickled by reference. Dynamically
+    composed classes reduce to a recipe consisting of base classes,
+    behaviors and class body extras, which get pickled by reference
+    themselves.
+    """
+    if _is_importable(cls):
+        return cls.__qualname__
+    module = cls.__module__
+    qualname = cls.__qualname__
+    behaviors = cls.__dict__.get('__plumbing__')
+    namespace = cls.__dict__['__plumbing_namespace__']
+    key = _composition_key(module, qualname, cls.__bases__, behaviors, namespace)
+    if key is not None:
+        _compositions[key] = cls
+    return rebuild_plumbing, (module, qualname, cls.__bases__, behaviors, namespace)
+
+
+copyreg.pickle(plumber, reduce_plumbing)
+
+
+def namespace(cls):
+    """Namespace of an existing class, as passed to its metaclass."""
+    # Basically taken from six
+    dct = cls.__dict__.copy()
+    dct.pop('__dict__', None)
+    dct.pop('__weakref__', None)
+    slots = dct.get('__slots__')
+    if slots is not None:
+        if isinstance(slots, str):
+            slots = [slots]
+        for slots_var in slots:
+            dct.pop(slots_var, None)
+    dct['__qualname__'] = cls.__qualname__
+    return dct
 
 
 class plumbing(object):
-    """Plumbing decorator."""
+    """Plumbing decorator.
+
+    By default the decorated class is built again by ``plumber``. With
+    ``inplace=True``, behaviors are applied to the decorated class itself.
+    """
 
-    def __init__(self, *behaviors):
+    def __init__(self, *behaviors, inplace=False):
         assert len(behaviors) > 0
         self.behaviors = behaviors
+        self.inplace = inplace
 
     def __call__(self, cls):
-        # Basically taken from six
-        orig_vars = cls.__dict__.copy()
-        orig_vars.pop('__dict__', None)
-        orig_vars.pop('__weakref__', None)
-        slots = orig_vars.get('__slots__')
-        if slots is not None:
-            if isinstance(slots, str):
-                slots = [slots]
-            for slots_var in slots:
-                orig_vars.pop(slots_var)
+        if self.inplace:
+            return inplace(cls, self.behaviors)
+        orig_vars = namespace(cls)
         orig_vars['__plumbing__'] = self.behaviors
         return plumber(cls.__name__, cls.__bases__, orig_vars)
@@ -0,0 +1,209 @@
+"""Record calls into plumbing pipelines and replay them.
+
+Recorded traces capture how plumbing classes are actually used. Replaying a
+trace against other plumbing classes, e.g. built with other behaviors,
+reports latency distributions per method for comparison.
+"""
+
+from .behavior import resolve
+from .plumber import key_of
+from .plumber import plumbing_classes
+import base64
+import contextlib
+import inspect
+import json
+import pickle
+import threading
+import time
+import types
+
+
+class Recorder(object):
+    """Write calls into plumbing pipelines to a trace file.
+
+    Each line of the trace is a JSON object containing the class, the
+    number of the instance within the trace, the method and the arguments
+    serialized by ``serializer``. Only outermost calls are recorded, calls
+    made by pipelines themselves are part of the outer call.
+    """
+
+    def __init__(self, path, serializer=pickle):
+        self.file = open(path, 'w')
+        self.serializer = serializer
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Instances are kept referenced while recording, thus their ids are
+        # not reused.
+        self.instances = dict()
+
+    def wrap(self, name, entrance):
+        """An entrance recording calls before calling entrance."""
+        recorder = self
+
+        def recording(self, *args, **kw):
+            local = recorder.local
+            if getattr(local, 'active', False):
+                return entrance(self, *args, **kw)
+            recorder.write(self, name, args, kw)
+            local.active = True
+            try:
+                return entrance(self, *args, **kw)
+            finally:
+                local.active = False
+
+        recording.__doc__ = entrance.__doc__
+        recording.__name__ = entrance.__name__
+        return recording
+
+    def write(self, obj, name, args, kw):
+        data = self.serializer.dumps((args, kw))
+        event = dict(cls=key_of(type(obj)), method=name)
+        if isinstance(data, bytes):
+            event['data'] = base64.b64encode(data).decode('ascii')
+        else:
+            event['text'] = data
+        with self.lock:
+            number = self.instances.get(id(obj), (None,))[0]
+            if number is None:
+                number = len(self.instances)
+                self.instances[id(obj)] = (number, obj)
+            event['instance'] = number
+            self.file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        self.file.close()
+        self.instances.clear()
+
+
+@contextlib.contextmanager
+def record(path, *classes, serializer=pickle):
+    """Record calls into the method pipelines of plumbing classes to path.
+
+    Without classes, all plumbing classes are recorded. While recording,
+    recording entrances are installed on the plumbing classes. Coroutine
+    functions and properties are not recorded.
+    """
+    if not classes:
+        classes = plumbing_classes()
+    recorder = Recorder(path, serializer=serializer)
+    installed = []
+    for cls in classes:
+        stacks = cls.__dict__.get('__plumbing_stacks__')
+        if stacks is None:
+            continue
+        for name in stacks.entrances:
+            entrance = cls.__dict__.get(name)
+            if not isinstance(entrance, types.FunctionType):
+                continue
+            if inspect.iscoroutinefunction(entrance):
+                continue
+            recording = recorder.wrap(name, entrance)
+            setattr(cls, name, recording)
+            installed.append((cls, name, entrance, recording))
+    try:
+        yield recorder
+    finally:
+        for cls, name, entrance, recording in installed:
+            if cls.__dict__.get(name) is recording:
+                setattr(cls, name, entrance)
+        recorder.close()
+
+
+class Latencies(object):
+    """Latency distribution of a method in nanoseconds."""
+
+    def __init__(self):
+        self.samples = []
+        self.errors = 0
+
+    def add(self, elapsed, error=False):
+        self.samples.append(elapsed)
+        if error:
+            self.errors += 1
+
+    @property
+    def count(self):
+        return len(self.samples)
+
+    @property
+    def mean(self):
+        return sum(self.samples) / len(self.samples)
+
+    def percentile(self, percent):
+        samples = sorted(self.samples)
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+
+def create_instance(cls, event):
+    """Default factory for replayed instances.
+
+    If the first recorded call of an instance is ``__init__``, it is created
+    uninitialized, otherwise by calling ``cls`` without arguments.
+    """
+    if event['method'] == '__init__':
+        return cls.__new__(cls)
+    return cls()
+
+
+def replay(path, classes=None, factory=create_instance, serializer=pickle):
+    """Replay a trace and return latencies by class key and method.
+
+    ``classes`` maps class keys as recorded, ``module:qualname``, to the
+    plumbing classes to replay against. Classes not contained are imported.
+    Instances are created by ``factory`` with the class and the first event
+    of the instance. Errors raised by replayed calls are counted.
+    """
+    classes = dict(classes or {})
+    instances = dict()
+    latencies = dict()
+    with open(path) as trace:
+        for line in trace:
+            event = json.loads(line)
+            key = event['cls']
+            cls = classes.get(key)
+            if cls is None:
+                cls = classes[key] = resolve(key)
+            obj = instances.get(event['instance'])
+            if obj is None:
+                obj = instances[event['instance']] = factory(cls, event)
+            if 'data' in event:
+                args, kw = serializer.loads(base64.b64decode(event['data']))
+            else:
+                args, kw = serializer.loads(event['text'])
+            method = getattr(obj, event['method'])
+            error = False
+            start = time.perf_counter_ns()
+            try:
+                method(*args, **kw)
+            except Exception:
+                error = True
+            elapsed = time.perf_counter_ns() - start
+            stats = latencies.get((key, event['method']))
+            if stats is None:
+                stats = latencies[(key, event['method'])] = Latencies()
+            stats.add(elapsed, error)
+    return latencies
+
+
+def report(latencies):
+    """Format latencies as returned by ``replay`` as table in microseconds."""
+    lines = [
+        '%-40s %-16s %8s %8s %8s %8s %8s %6s'
+        % ('class', 'method', 'count', 'mean', 'p50', 'p90', 'p99', 'errors')
+    ]
+    for (key, method), stats in sorted(latencies.items()):
+        lines.append(
+            '%-40s %-16s %8i %8.2f %8.2f %8.2f %8.2f %6i'
+            % (
+                key,
+                method,
+                stats.count,
+                stats.mean / 1000,
+                stats.percentile(50) / 1000,
+                stats.percentile(90) / 1000,
+                stats.percentile(99) / 1000,
+                stats.errors,
+            )
+        )
+    return '\n'.join(lines)
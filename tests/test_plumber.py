@@ -1,20 +1,64 @@
 from plumber import Behavior
+from plumber import FanoutError
 from plumber import PlumbingCollision
+from plumber import after
+from plumber import batch
+from plumber import before
+from plumber import collect
+from plumber import collectdict
+from plumber import computed
+from plumber import coverage
 from plumber import default
+from plumber import extend
+from plumber import fanout
 from plumber import finalize
+from plumber import first
+from plumber import freeze
+from plumber import has_behavior
+from plumber import memory_report
 from plumber import override
+from plumber import parametric
 from plumber import plumb
 from plumber import plumber
+from plumber import plumbif
 from plumber import plumbifexists
 from plumber import plumbing
+from plumber import plumbtype
+from plumber import replumb
+from plumber import suspended
+from plumber import synchronized
+from plumber import tracing
+from plumber import when
+from plumber.behavior import Conditional
 from plumber.behavior import behaviormetaclass
+from plumber.behavior import resolve
 from plumber.instructions import Instruction
+from plumber.instructions import Stage2Instruction
 from plumber.instructions import _implements
+from plumber.instructions import _instance_locks
+from plumber.instructions import lockof
+from plumber.instructions import lookup_merge
+from plumber.instructions import merge
+from plumber.instructions import merge_plumb
 from plumber.instructions import payload
 from plumber.instructions import plumb_str
+from plumber.instructions import register_merge
+from plumber.instructions import unregister_merge
+from plumber.plumber import dependents
 from zope.interface import Interface
 from zope.interface import implementer
+import asyncio
+import copy
 import inspect
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
 import unittest
 
 
@@ -196,6 +240,33 @@ class TestInstructions(unittest.TestCase):
             self.assertEqual(err.right.__class__.__name__, 'plumb')
             self.assertEqual(err.right.payload, 2)
 
+    def test_merge(self):
+        self.assertTrue(lookup_merge(plumbifexists, before) is merge_plumb)
+        self.assertTrue(lookup_merge(default, plumb) is None)
+
+        class traced(Stage2Instruction):
+            def __call__(self, cls):
+                cls.traced = self.payload
+
+        def merge_traced(left, right):
+            return traced(left.payload + right.payload, name=left.name)
+
+        def merge_traced_plumb(left, right):
+            return left
+
+        register_merge(traced, traced, merge_traced)
+        register_merge(traced, plumb, merge_traced_plumb)
+        try:
+            self.assertEqual(merge(traced(('a',)), traced(('b',))).payload, ('a', 'b'))
+            tr = traced(('a',))
+            self.assertTrue(merge(tr, before(len)) is tr)
+            with self.assertRaises(PlumbingCollision):
+                merge(plumb(len), tr)
+        finally:
+            unregister_merge(traced, traced)
+            unregister_merge(traced, plumb)
+        self.assertTrue(lookup_merge(traced, plumb) is None)
+
     def test_implements(self):
         # classImplements interfaces
         foo = _implements(('foo',))
@@ -252,6 +323,22 @@ class TestPlumber(unittest.TestCase):
         self.assertTrue('foo' in plumber.derived_members((B,)))
         self.assertFalse('bar' in plumber.derived_members((B,)))
 
+    def test_metaclass_namespace(self):
+        # Helpers of the plumber are no attributes of plumbing classes.
+        class Behavior1(Behavior):
+            @plumbifexists
+            def prepare(next_, self):
+                return next_(self)  # pragma: no cover
+
+        @plumbing(Behavior1)
+        class Plumbing(object):
+            pass
+
+        self.assertFalse(hasattr(Plumbing, 'prepare'))
+        self.assertFalse(hasattr(Plumbing(), 'prepare'))
+        for name in ('replumb', 'suspended', 'has_behavior', 'memory_report'):
+            self.assertFalse(hasattr(Plumbing, name))
+
 
 class TestMetaclassHooks(unittest.TestCase):
     def test_metaclasshook(self):
@@ -541,6 +628,147 @@ class TestPlumberStage1(unittest.TestCase):
             res.append('%s from %s' % (x, getattr(Plumbing, x)))
         self.assertEqual(res, ['K from Behavior2', 'L from Behavior1'])
 
+    def test_computed(self):
+        calls = list()
+
+        class Behavior1(Behavior):
+            @default
+            @computed
+            def table():
+                calls.append('Behavior1')
+                return dict(a=1)
+
+        class Behavior2(Behavior):
+            @override
+            @computed
+            def table():
+                calls.append('Behavior2')
+                return dict(b=2)
+
+        @plumbing(Behavior1)
+        class Plumbing1(object):
+            pass
+
+        @plumbing(Behavior1)
+        class Plumbing2(object):
+            pass
+
+        @plumbing(Behavior1, Behavior2)
+        class Plumbing3(object):
+            pass
+
+        @plumbing(Behavior1, Behavior2)
+        class Plumbing4(object):
+            table = dict(c=3)
+
+        self.assertEqual(calls, [])
+        self.assertTrue(isinstance(Plumbing1.__dict__['table'], computed))
+        self.assertEqual(Plumbing1().table, dict(a=1))
+        self.assertEqual(Plumbing1.__dict__['table'], dict(a=1))
+        self.assertTrue(Plumbing2.table is Plumbing1.table)
+        self.assertEqual(calls, ['Behavior1'])
+        self.assertEqual(Plumbing3.table, dict(b=2))
+        self.assertEqual(Plumbing4.table, dict(c=3))
+        self.assertEqual(calls, ['Behavior1', 'Behavior2'])
+
+    def test_computed_threadsafe(self):
+        calls = list()
+
+        def factory():
+            calls.append(None)
+            time.sleep(0.01)
+            return object()
+
+        class Behavior1(Behavior):
+            table = default(computed(factory))
+
+        @plumbing(Behavior1)
+        class Plumbing(object):
+            pass
+
+        results = list()
+        threads = [
+            threading.Thread(target=lambda: results.append(Plumbing.table))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(map(id, results))), 1)
+
+    def test_extend(self):
+        class Behavior1(Behavior):
+            names = extend(('a', 'b'))
+            flags = extend({'x'})
+            table = extend(dict(a=1))
+
+        class Behavior2(Behavior):
+            names = extend(['b', 'c'])
+            flags = extend(frozenset(['y']))
+            table = extend(dict(b=2))
+
+        @plumbing(Behavior1, Behavior2)
+        class Plumbing(object):
+            names = ('z', 'a')
+
+        self.assertEqual(Plumbing.names, ('z', 'a', 'b', 'c'))
+        self.assertEqual(Plumbing.flags, frozenset(['x', 'y']))
+        self.assertEqual(Plumbing.table, dict(a=1, b=2))
+        self.assertTrue(isinstance(Plumbing.table, types.MappingProxyType))
+
+        class Behavior3(Behavior):
+            names = extend(('d',))
+            table = extend(dict(a=3))
+
+        @plumbing(Behavior3)
+        class Subclass(Plumbing):
+            pass
+
+        self.assertEqual(Subclass.names, ('z', 'a', 'b', 'c', 'd'))
+        self.assertEqual(Subclass.table, dict(a=3, b=2))
+        self.assertEqual(Plumbing.table, dict(a=1, b=2))
+
+        self.assertRaises(TypeError, extend, 'abc')
+
+    def test_extend_collisions(self):
+        class Behavior1(Behavior):
+            table = extend(dict(a=1))
+
+        class Behavior2(Behavior):
+            table = extend(dict(a=2))
+
+        class Behavior3(Behavior):
+            table = extend(('a',))
+
+        class Behavior4(Behavior):
+            table = extend(dict(a=1))
+
+        @plumbing(Behavior1, Behavior4)
+        class Plumbing(object):
+            pass
+
+        self.assertEqual(Plumbing.table, dict(a=1))
+
+        with self.assertRaises(PlumbingCollision):
+
+            @plumbing(Behavior1, Behavior2)
+            class Plumbing1(object):
+                pass
+
+        with self.assertRaises(PlumbingCollision):
+
+            @plumbing(Behavior1, Behavior3)
+            class Plumbing2(object):
+                pass
+
+        with self.assertRaises(PlumbingCollision):
+
+            @plumbing(Behavior1)
+            class Plumbing3(object):
+                table = dict(a=2)
+
     def test_subclassing_behaviors(self):
         class Behavior1(Behavior):
             J = default('Behavior1')
@@ -680,6 +908,94 @@ class TestPlumberStage2(unittest.TestCase):
         plb.foo = 4
         self.assertEqual(plb.foo, 8)
 
+    def test_property_accessors(self):
+        res = list()
+
+        class Behavior1(Behavior):
+            @plumb
+            @property
+            def foo(next_, self):
+                return 'Behavior1 ' + next_(self)
+
+            @foo.setter
+            def foo(next_, self, value):
+                res.append(('Behavior1', value))
+                next_(self, value.upper())
+
+        class Behavior2(Behavior):
+            @plumb
+            @property
+            def foo(next_, self):
+                return 'Behavior2 ' + next_(self)
+
+            @foo.deleter
+            def foo(next_, self):
+                res.append('Behavior2 del')
+                next_(self)
+
+        @plumbing(Behavior1, Behavior2)
+        class Plumbing(object):
+            @property
+            def foo(self):
+                return self._foo
+
+            @foo.setter
+            def foo(self, value):
+                self._foo = value
+
+        plb = Plumbing()
+        plb.foo = 'foo'
+        self.assertEqual(plb.foo, 'Behavior1 Behavior2 FOO')
+        self.assertEqual(res, [('Behavior1', 'foo')])
+
+        # Each accessor is compiled into a flat chain, the endpoint accessor
+        # is called directly by the innermost entrance.
+        fset = Plumbing.__dict__['foo'].fset
+        self.assertTrue(Plumbing.__plumbing_stacks__.endpoints['foo'] is not None)
+        cells = [cell.cell_contents for cell in fset.__closure__]
+        endpoint = Plumbing.__plumbing_stacks__.endpoints['foo']
+        self.assertTrue(endpoint.fset in cells)
+
+        # The plumbed property has no deleter.
+        with self.assertRaises(AttributeError) as arc:
+            del plb.foo
+        self.assertEqual(
+            str(arc.exception), "property 'foo' of 'Plumbing' object has no deleter"
+        )
+        self.assertEqual(res, [('Behavior1', 'foo'), 'Behavior2 del'])
+
+        # Layers of subclasses get fused.
+        class Behavior3(Behavior):
+            @plumb
+            @property
+            def foo(next_, self):
+                return 'Behavior3 ' + next_(self)
+
+        @plumbing(Behavior3)
+        class Sub(Plumbing):
+            pass
+
+        sub = Sub()
+        sub.foo = 'sub'
+        self.assertEqual(sub.foo, 'Behavior3 Behavior1 Behavior2 SUB')
+        self.assertEqual(len(Sub.__plumbing_stacks__.layers['foo']), 3)
+
+        with suspended(Plumbing, Behavior1):
+            plb.foo = 'bar'
+            self.assertEqual(plb.foo, 'Behavior2 bar')
+        self.assertEqual(plb.foo, 'Behavior1 Behavior2 bar')
+
+        with self.assertRaises(TypeError):
+
+            class Behavior4(Behavior):
+                @plumb
+                def foo(next_, self):
+                    return next_(self)  # pragma: no cover
+
+                @foo.setter
+                def foo(next_, self, value):
+                    next_(self, value)  # pragma: no cover
+
     def test_subclassing_behaviors(self):
         class Behavior1(Behavior):
             @plumb
@@ -707,132 +1023,1774 @@ class TestPlumberStage2(unittest.TestCase):
         self.assertEqual(plb.foo(), 'Behavior2 Behavior1 foo')
         self.assertEqual(plb.bar(), 'Behavior1 bar')
 
-    def test_mixing_properties_and_methods(self):
-        err = None
+    def test_conditional_instructions(self):
+        settings = dict(events=False, default=True)
 
         class Behavior1(Behavior):
-            @plumb
+            @plumbif(lambda: settings['events'])
             def foo(next_, self):
-                return next_(self)  # pragma: no cover
+                return 'event ' + next_(self)
 
-        try:
+            @when(lambda: settings['default'])
+            @default
+            def bar(self):
+                return 'bar'
 
-            @plumbing(Behavior1)
-            class Plumbing(object):
-                @property
-                def foo(self):
-                    return 5  # pragma: no cover
-        except PlumbingCollision as e:
-            err = e
-        finally:
-            self.assertEqual(err.left.__parent__.__name__, 'Behavior1')
-            self.assertEqual(err.left.__class__.__name__, 'plumb')
-            self.assertEqual(err.left.__name__, 'foo')
-            self.assertEqual(err.left.payload.__name__, 'foo')
-            self.assertEqual(err.right.__name__, 'Plumbing')
-            self.assertTrue(inspect.isclass(err.right))
+            @plumbif(True)
+            def baz(next_, self):
+                return 'baz ' + next_(self)
 
-    def test_docstrings_joined(self):
-        class P1(Behavior):
-            """P1"""
+        class Plumbing(object, metaclass=plumber):
+            __plumbing__ = Behavior1
 
-            @plumb
             def foo(self):
-                """P1.foo"""
+                return 'foo'
 
-            bar = plumb(property(None, None, None, 'P1.bar'))
+            def baz(self):
+                return 'baz'
 
-        class P2(Behavior):
-            @override
-            def foo(self):
-                """P2.foo"""
+        self.assertEqual(Plumbing().foo(), 'foo')
+        self.assertEqual(Plumbing().bar(), 'bar')
+        self.assertEqual(Plumbing().baz(), 'baz baz')
+        self.assertFalse('foo' in Plumbing.__plumbing_stacks__.stage2)
 
-            bar = plumb(property(None, None, None, 'P2.bar'))
+        settings.update(events=True, default=False)
 
-        @plumbing(P1, P2)
+        class Plumbing2(Plumbing):
+            __plumbing__ = Behavior1
+
+        self.assertEqual(Plumbing2().foo(), 'event foo')
+        self.assertEqual(Plumbing2().baz(), 'baz baz baz')
+        self.assertFalse('bar' in Plumbing2.__dict__)
+
+    def test_conditional_behaviors(self):
+        class Behavior1(Behavior):
+            @plumb
+            def foo(next_, self):
+                return 'Behavior1 ' + next_(self)
+
+        class Behavior2(Behavior):
+            @plumb
+            def foo(next_, self):
+                return 'Behavior2 ' + next_(self)
+
+        @plumbing(Behavior1.when(False), Behavior2.when(lambda: True))
         class Plumbing(object):
-            """Plumbing"""
+            def foo(self):
+                return 'foo'
 
-            bar = property(None, None, None, 'Plumbing.bar')
+        self.assertEqual(Plumbing.__plumbing__, (Behavior2,))
+        self.assertEqual(Plumbing().foo(), 'Behavior2 foo')
 
-        self.assertEqual(Plumbing.__doc__.strip(), 'Plumbing\n\nP1')
-        self.assertEqual(Plumbing.foo.__doc__.strip(), 'P2.foo\n\nP1.foo')
-        self.assertEqual(
-            Plumbing.bar.__doc__.strip(), 'Plumbing.bar\n\nP2.bar\n\nP1.bar'
-        )
+    def test_subclassing_plumbings(self):
+        def create_behavior(name):
+            class Layer(Behavior):
+                @plumb
+                def foo(next_, self):
+                    return name + ' ' + next_(self)
 
-    def test_slots(self):
-        class P1(Behavior):
-            @default
-            def somewhing_which_writes_to_foo(self, foo_val):
-                self.foo = foo_val
+            return Layer
 
-        @plumbing(P1)
-        class WithSlots(object):
-            __slots__ = 'foo'
+        @plumbing(create_behavior('Framework'))
+        class Framework(object):
+            def foo(self):
+                return 'foo'
 
-        self.assertEqual(type(WithSlots.__dict__['foo']).__name__, 'member_descriptor')
-        ob = WithSlots()
-        ob.somewhing_which_writes_to_foo('foo')
-        self.assertEqual(ob.foo, 'foo')
+        class Intermediate(Framework):
+            pass
 
-    def test_zope_interface(self):
-        class IBase(Interface):
+        @plumbing(create_behavior('Library1'), create_behavior('Library2'))
+        class Library(Intermediate):
             pass
 
-        @implementer(IBase)
-        class Base(object):
+        @plumbing(create_behavior('Application'))
+        class Application(Library):
             pass
 
-        self.assertTrue(IBase.implementedBy(Base))
+        self.assertEqual(
+            Application().foo(), 'Application Library1 Library2 Framework foo'
+        )
+        # Pipelines of plumbing base classes get fused
+        stacks = Framework.__plumbing_stacks__
+        self.assertEqual(len(stacks.layers['foo']), 1)
+        endpoint = stacks.endpoints['foo']
+        self.assertEqual(endpoint(None), 'foo')
+        stacks = Application.__plumbing_stacks__
+        self.assertEqual(len(stacks.layers['foo']), 4)
+        self.assertTrue(stacks.endpoints['foo'] is endpoint)
+        self.assertTrue(stacks.entrances['foo'] is Application.__dict__['foo'])
+
+        # Fusing stops at endpoints declared on plumbing classes
+        @plumbing(create_behavior('Overridden'))
+        class Overridden(Framework):
+            def foo(self):
+                return 'overridden ' + Framework.foo(self)
 
-        class IBehavior1(Interface):
+        @plumbing(create_behavior('Sub'))
+        class Sub(Overridden):
             pass
 
-        @implementer(IBehavior1)
-        class Behavior1(Behavior):
-            blub = 1
+        self.assertEqual(Sub().foo(), 'Sub Overridden overridden Framework foo')
+        stacks = Sub.__plumbing_stacks__
+        self.assertEqual(len(stacks.layers['foo']), 2)
+        self.assertTrue(
+            stacks.endpoints['foo'] is Overridden.__plumbing_stacks__.endpoints['foo']
+        )
 
-        class IBehavior2Base(Interface):
-            pass
+    def test_dispatch(self):
+        calls = list()
 
-        @implementer(IBehavior2Base)
-        class Behavior2Base(Behavior):
-            pass
+        class Behavior1(Behavior):
+            @first
+            def resolve(self, key):
+                calls.append('Behavior1')
+                if key == 'a':
+                    return 'Behavior1'
 
-        class IBehavior2(Interface):
-            pass
+            @collect
+            def validate(self, value):
+                return value > 0
 
-        @implementer(IBehavior2)
-        class Behavior2(Behavior2Base):
-            pass
+            @collectdict
+            def schema(self):
+                return dict(a='Behavior1')
 
-        self.assertTrue(IBehavior1.implementedBy(Behavior1))
-        self.assertTrue(IBehavior2Base.implementedBy(Behavior2Base))
-        self.assertTrue(IBehavior2Base.implementedBy(Behavior2))
-        self.assertTrue(IBehavior2.implementedBy(Behavior2))
+        class Behavior2(Behavior):
+            @first
+            def resolve(self, key):
+                calls.append('Behavior2')
+                if key in ('a', 'b'):
+                    return 'Behavior2'
 
-        class IPlumbingClass(Interface):
-            pass
+            @collect
+            def validate(self, value):
+                return value < 10
+
+            @collectdict
+            def schema(self):
+                return dict(a='Behavior2', b='Behavior2')
 
-        @implementer(IPlumbingClass)
         @plumbing(Behavior1, Behavior2)
-        class PlumbingClass(Base):
+        class Plumbing(object):
+            def resolve(self, key):
+                calls.append('Plumbing')
+                return 'Plumbing'
+
+            def schema(self):
+                return dict(c='Plumbing')
+
+        plb = Plumbing()
+        self.assertEqual(plb.resolve('a'), 'Behavior1')
+        self.assertEqual(calls, ['Behavior1'])
+        self.assertEqual(plb.resolve('b'), 'Behavior2')
+        self.assertEqual(plb.resolve('c'), 'Plumbing')
+        self.assertEqual(plb.validate(5), [True, True])
+        self.assertEqual(plb.validate(20), [True, False])
+        self.assertEqual(plb.schema(), dict(a='Behavior1', b='Behavior2', c='Plumbing'))
+
+        class Behavior3(Behavior):
+            @first
+            def resolve(self, key):
+                if key == 'c':
+                    return 'Behavior3'
+
+        @plumbing(Behavior3)
+        class Sub(Plumbing):
             pass
 
-        self.assertTrue(IPlumbingClass.implementedBy(PlumbingClass))
-        self.assertTrue(IBase.implementedBy(PlumbingClass))
-        self.assertTrue(IBehavior1.implementedBy(PlumbingClass))
-        self.assertTrue(IBehavior2.implementedBy(PlumbingClass))
-        self.assertTrue(IBehavior2Base.implementedBy(PlumbingClass))
+        self.assertEqual(Sub().resolve('c'), 'Behavior3')
+        self.assertEqual(Sub().resolve('d'), 'Plumbing')
+        self.assertEqual(len(Sub.__plumbing_stacks__.layers['resolve']), 3)
 
-        plb = PlumbingClass()
+        with suspended(plb, Behavior1):
+            self.assertEqual(plb.resolve('a'), 'Behavior2')
+            self.assertEqual(plb.validate(20), [False])
 
-        self.assertTrue(IPlumbingClass.providedBy(plb))
-        self.assertTrue(IBase.providedBy(plb))
-        self.assertTrue(IBehavior1.providedBy(plb))
-        self.assertTrue(IBehavior2.providedBy(plb))
-        self.assertTrue(IBehavior2Base.providedBy(plb))
+        class Behavior4(Behavior):
+            @plumb
+            def resolve(next_, self, key):
+                return next_(self, key)  # pragma: no cover
+
+        with self.assertRaises(PlumbingCollision):
+
+            @plumbing(Behavior1, Behavior4)
+            class Plumbing2(object):
+                pass
+
+    def test_plumbtype(self):
+        calls = list()
+
+        class Strings(Behavior):
+            @plumbtype.of(str)
+            def __getitem__(next_, self, key):
+                calls.append('Strings')
+                return next_(self, key.lower())
+
+        class Numbers(Behavior):
+            @plumbtype.of(int)
+            def __getitem__(next_, self, key):
+                calls.append('Numbers int')
+                return next_(self, str(int(key)))
+
+            @__getitem__.register(float)
+            def _(next_, self, key):
+                calls.append('Numbers float')
+                return next_(self, str(int(key)))
+
+        class Logging(Behavior):
+            @plumb
+            def __getitem__(next_, self, key):
+                calls.append('Logging')
+                return next_(self, key)
+
+        @plumbing(Strings, Logging, Numbers)
+        class Plumbing(dict):
+            pass
+
+        plb = Plumbing({'a': 'A', '1': 'One'})
+        self.assertEqual(plb['A'], 'A')
+        self.assertEqual(calls, ['Strings', 'Logging'])
+        del calls[:]
+        self.assertEqual(plb[1], 'One')
+        self.assertEqual(calls, ['Logging', 'Numbers int'])
+        del calls[:]
+        # Subclasses of registered types dispatch to the registered method.
+        self.assertEqual(plb[True], 'One')
+        self.assertEqual(plb[1.0], 'One')
+        self.assertEqual(calls, ['Logging', 'Numbers int', 'Logging', 'Numbers float'])
+        del calls[:]
+        with self.assertRaises(KeyError):
+            plb[None]
+        self.assertEqual(calls, ['Logging'])
+
+        # Layers of plumbing base classes are fused.
+        class Bytes(Behavior):
+            @plumbtype.of(bytes)
+            def __getitem__(next_, self, key):
+                calls.append('Bytes')
+                return next_(self, key)
+
+        @plumbing(Bytes)
+        class Sub(Plumbing):
+            pass
+
+        del calls[:]
+        self.assertEqual(Sub({b'a': 'A'})[b'a'], 'A')
+        self.assertEqual(calls, ['Bytes', 'Logging'])
+        self.assertEqual(len(Sub.__plumbing_stacks__.layers['__getitem__']), 4)
+
+        with suspended(plb, Strings):
+            with self.assertRaises(KeyError):
+                plb['A']
+        self.assertEqual(plb['A'], 'A')
+
+        self.assertEqual(Strings.__dict__['__getitem__'].dispatch(bool), None)
+        self.assertTrue(Numbers.__dict__['__getitem__'].dispatch(bool) is not None)
+
+    def test_plumbtype_keyword(self):
+        class Strings(Behavior):
+            @plumbtype.of(str)
+            def get(next_, self, key, default=None):
+                return next_(self, key.lower(), default)
+
+        @plumbing(Strings)
+        class Plumbing(dict):
+            def get(self, key='a', default=None):
+                return dict.get(self, key, default)
+
+        plb = Plumbing(a='A')
+        self.assertEqual(plb.get('A'), 'A')
+        # The first argument may be passed by keyword.
+        self.assertEqual(plb.get(key='A'), 'A')
+        self.assertEqual(plb.get(key='B', default='-'), '-')
+        # Without argument, the chain for ``object`` is called.
+        self.assertEqual(plb.get(), 'A')
+
+    def test_synchronized(self):
+        events = list()
+
+        class Store(Behavior):
+            @synchronized()
+            @plumb
+            def __setitem__(next_, self, key, value):
+                events.append(('enter', key))
+                time.sleep(0.01)
+                next_(self, key, value)
+                events.append(('exit', key))
+
+        class Validate(Behavior):
+            @plumb
+            def __setitem__(next_, self, key, value):
+                # The lock is reentrant.
+                self.count = self.count + 1 if 'count' in self.__dict__ else 1
+                next_(self, key, value)
+
+        @plumbing(Store, Validate)
+        class Plumbing(dict):
+            pass
+
+        plb = Plumbing()
+        threads = [
+            threading.Thread(target=plb.__setitem__, args=(index, index))
+            for index in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(plb), 4)
+        self.assertEqual(plb.count, 4)
+        for index in range(0, 8, 2):
+            self.assertEqual(events[index][0], 'enter')
+            self.assertEqual(events[index + 1], ('exit', events[index][1]))
+
+        # One lock per instance, kept outside of the instance.
+        lock = lockof(plb)
+        self.assertEqual(type(lock), type(threading.RLock()))
+        self.assertEqual(vars(plb), dict(count=4))
+        self.assertEqual(lockof(Plumbing()), None)
+        copied = copy.copy(plb)
+        copied['a'] = 1
+        self.assertFalse(lockof(copied) is lock)
+        deepcopied = copy.deepcopy(plb)
+        deepcopied['a'] = 1
+        self.assertFalse(lockof(deepcopied) is lock)
+        key = (id(copied), True)
+        del copied
+        self.assertFalse(key in _instance_locks)
+
+        # Locks declared by layers of fused plumbing base classes are kept.
+        class Sub(Plumbing):
+            __plumbing__ = Validate
+
+        sub = Sub()
+        sub['a'] = 1
+        self.assertFalse(lockof(sub) is None)
+
+        # Instances of slotted classes must support weak references.
+        @plumbing(Store)
+        class Slotted(object):
+            __slots__ = ('data', '__weakref__')
+
+            def __init__(self):
+                self.data = dict()
+
+            def __setitem__(self, key, value):
+                self.data[key] = value
+
+        slotted = Slotted()
+        slotted['a'] = 1
+        self.assertEqual(slotted.data, dict(a=1))
+        self.assertFalse(lockof(slotted) is None)
+
+        with self.assertRaises(TypeError):
+
+            @plumbing(Store)
+            class NoWeakref(object):
+                __slots__ = ()
+
+                def __setitem__(self, key, value):
+                    pass  # pragma: no cover
+
+        class Other(Behavior):
+            @synchronized('class')
+            @plumb
+            def __setitem__(next_, self, key, value):
+                next_(self, key, value)  # pragma: no cover
+
+        with self.assertRaises(PlumbingCollision):
+
+            @plumbing(Store, Other)
+            class Plumbing2(dict):
+                pass
+
+        class Named(Behavior):
+            @synchronized('test_synchronized', reentrant=False)
+            @plumb
+            @property
+            def value(next_, self):
+                return next_(self)
+
+        @plumbing(Named)
+        class Plumbing3(object):
+            value = property(lambda self: 'value')
+
+        self.assertEqual(Plumbing3().value, 'value')
+
+        class Reentrant(Behavior):
+            @synchronized('test_synchronized')
+            @plumb
+            def foo(next_, self):
+                return next_(self)  # pragma: no cover
+
+        with self.assertRaises(ValueError):
+
+            @plumbing(Reentrant)
+            class Plumbing4(object):
+                def foo(self):
+                    return 'foo'  # pragma: no cover
+
+        with self.assertRaises(TypeError):
+            synchronized()(lambda self: None)
+
+    def test_batch_synchronized(self):
+        owned = list()
+
+        class Store(Behavior):
+            @synchronized()
+            @plumb
+            def __setitem__(next_, self, key, value):
+                owned.append(lockof(self)._is_owned())
+                next_(self, key, value)
+
+        class Batch(Behavior):
+            @batch.of('__setitem__')
+            def setitems(next_, self, items):
+                owned.append(lockof(self)._is_owned())
+                next_(self, items)
+
+        @plumbing(Store, Batch)
+        class Plumbing(dict):
+            pass
+
+        plb = Plumbing()
+        plb['a'] = 1
+        # The lock of the scalar pipeline is held by the batch pipeline.
+        plb.setitems([('b', 2), ('c', 3)])
+        self.assertEqual(owned, [True, True, True, True])
+        self.assertEqual(plb, {'a': 1, 'b': 2, 'c': 3})
+
+    def test_fanout(self):
+        threads = set()
+
+        def create_backend(name, delay):
+            class Backend(Behavior):
+                @fanout
+                def __setitem__(self, key, value):
+                    threads.add(threading.current_thread())
+                    time.sleep(delay)
+                    if value is None:
+                        raise ValueError(name)
+                    return name
+
+            return Backend
+
+        @plumbing(
+            create_backend('a', 0.1), create_backend('b', 0.1), create_backend('c', 0.1)
+        )
+        class Plumbing(object):
+            pass
+
+        plb = Plumbing()
+        start = time.time()
+        self.assertEqual(plb.__setitem__('key', 'value'), ['a', 'b', 'c'])
+        self.assertTrue(time.time() - start < 0.25)
+        self.assertEqual(len(threads), 3)
+        self.assertTrue(threading.current_thread() in threads)
+
+        with self.assertRaises(FanoutError) as arc:
+            plb['key'] = None
+        self.assertEqual(
+            [str(error) for error in arc.exception.errors], ['a', 'b', 'c']
+        )
+
+        class Counter(Behavior):
+            @fanout.reduce(sum)
+            def count(self):
+                return 1
+
+        class Counter2(Behavior):
+            @fanout.reduce(sum)
+            def count(self):
+                return 2
+
+        @plumbing(Counter, Counter2)
+        class Counting(object):
+            def count(self):
+                return 3
+
+        self.assertEqual(Counting().count(), 6)
+
+        class Counter3(Behavior):
+            @fanout
+            def count(self):
+                return 1  # pragma: no cover
+
+        with self.assertRaises(PlumbingCollision):
+
+            @plumbing(Counter, Counter3)
+            class Counting2(object):
+                pass
+
+    def test_fanout_coroutines(self):
+        class Backend1(Behavior):
+            @fanout.reduce(max)
+            async def write(self, delay):
+                await asyncio.sleep(delay)
+                return 1
+
+        class Backend2(Behavior):
+            @fanout.reduce(max)
+            async def write(self, delay):
+                await asyncio.sleep(delay)
+                return 2
+
+        @plumbing(Backend1, Backend2)
+        class Plumbing(object):
+            async def write(self, delay):
+                if delay is None:
+                    raise ValueError('Plumbing')
+                await asyncio.sleep(delay)
+                return 3
+
+        plb = Plumbing()
+        start = time.time()
+        self.assertEqual(asyncio.run(plb.write(0.1)), 3)
+        self.assertTrue(time.time() - start < 0.25)
+
+        with self.assertRaises(FanoutError) as arc:
+            asyncio.run(plb.write(None))
+        self.assertEqual(len(arc.exception.errors), 3)
+
+        class Backend3(Behavior):
+            @fanout.reduce(max)
+            def write(self, delay):
+                return 3  # pragma: no cover
+
+        with self.assertRaises(TypeError):
+
+            @plumbing(Backend1, Backend3)
+            class Plumbing2(object):
+                pass
+
+    def test_suspended(self):
+        class Events(Behavior):
+            @plumb
+            def foo(next_, self):
+                return 'event ' + next_(self)
+
+        class Lower(Behavior):
+            @plumb
+            def foo(next_, self):
+                return next_(self).lower()
+
+        @plumbing(Events, Lower)
+        class Plumbing(object):
+            def foo(self):
+                return 'FOO'
+
+        entrance = Plumbing.__dict__.get('foo')
+        plb = Plumbing()
+        other = Plumbing()
+        self.assertEqual(plb.foo(), 'event foo')
+        with suspended(plb, Events):
+            self.assertEqual(plb.foo(), 'foo')
+            self.assertEqual(other.foo(), 'event foo')
+            with suspended(Plumbing, Lower):
+                self.assertEqual(plb.foo(), 'foo')
+                self.assertEqual(other.foo(), 'event FOO')
+                with suspended(plb, Lower):
+                    self.assertEqual(plb.foo(), 'FOO')
+            self.assertEqual(other.foo(), 'event foo')
+            # Suspension is local to the context
+            result = list()
+            thread = threading.Thread(target=lambda: result.append(plb.foo()))
+            thread.start()
+            thread.join()
+            self.assertEqual(result, ['event foo'])
+        self.assertEqual(plb.foo(), 'event foo')
+        self.assertTrue(Plumbing.__dict__.get('foo') is entrance)
+        variants = Plumbing.__plumbing_stacks__.variants
+        self.assertEqual(sorted(len(behaviors) for _, behaviors in variants), [1, 1, 2])
+
+    def test_suspended_base_plumbing(self):
+        class Behavior1(Behavior):
+            @plumb
+            def foo(next_, self):
+                return 'Behavior1 ' + next_(self)
+
+        class Behavior2(Behavior):
+            @plumb
+            def bar(next_, self):
+                return 'Behavior2 ' + next_(self)
+
+        @plumbing(Behavior1)
+        class Plumbing(object):
+            def foo(self):
+                return 'foo'
+
+            def bar(self):
+                return 'bar'
+
+        @plumbing(Behavior2)
+        class Sub(Plumbing):
+            pass
+
+        class Plain(Plumbing):
+            pass
+
+        sub = Sub()
+        # Pipelines built on plumbing base classes are dispatched.
+        with suspended(sub, Behavior1):
+            self.assertEqual(sub.foo(), 'foo')
+            self.assertEqual(Sub().foo(), 'Behavior1 foo')
+        with suspended(Sub, Behavior1):
+            self.assertEqual(sub.foo(), 'foo')
+            self.assertEqual(sub.bar(), 'Behavior2 bar')
+            self.assertEqual(Plumbing().foo(), 'Behavior1 foo')
+        # Suspensions of plumbing classes apply to instances of subclasses.
+        with suspended(Plumbing, Behavior1):
+            self.assertEqual(Plain().foo(), 'foo')
+            self.assertEqual(sub.foo(), 'foo')
+        self.assertEqual(sub.foo(), 'Behavior1 foo')
+        self.assertEqual(Plain().foo(), 'Behavior1 foo')
+        self.assertFalse('foo' in Sub.__dict__)
+
+    def test_mixing_properties_and_methods(self):
+        err = None
+
+        class Behavior1(Behavior):
+            @plumb
+            def foo(next_, self):
+                return next_(self)  # pragma: no cover
+
+        try:
+
+            @plumbing(Behavior1)
+            class Plumbing(object):
+                @property
+                def foo(self):
+                    return 5  # pragma: no cover
+        except PlumbingCollision as e:
+            err = e
+        finally:
+            self.assertEqual(err.left.__parent__.__name__, 'Behavior1')
+            self.assertEqual(err.left.__class__.__name__, 'plumb')
+            self.assertEqual(err.left.__name__, 'foo')
+            self.assertEqual(err.left.payload.__name__, 'foo')
+            self.assertEqual(err.right.__name__, 'Plumbing')
+            self.assertTrue(inspect.isclass(err.right))
+
+    def test_hooks(self):
+        res = list()
+
+        class Behavior1(Behavior):
+            @before
+            def __setitem__(self, key, value):
+                res.append(('Behavior1 before', key))
+
+        class Behavior2(Behavior):
+            @plumb
+            def __setitem__(next_, self, key, value):
+                res.append('Behavior2 start')
+                next_(self, key.lower(), value)
+                res.append('Behavior2 stop')
+
+        class Behavior3(Behavior):
+            @after
+            def __setitem__(self, key, value):
+                res.append(('Behavior3 after', key))
+
+        class Behavior4(Behavior):
+            @before
+            def __setitem__(self, key, value):
+                res.append(('Behavior4 before', key))
+
+            @after
+            def __getitem__(self, key):
+                res.append(('Behavior4 after', key))
+                return 'ignored'
+
+        @plumbing(Behavior1, Behavior2, Behavior3, Behavior4)
+        class Plumbing(dict):
+            pass
+
+        plb = Plumbing()
+        plb['A'] = 1
+        self.assertEqual(
+            res,
+            [
+                ('Behavior1 before', 'A'),
+                'Behavior2 start',
+                ('Behavior4 before', 'a'),
+                ('Behavior3 after', 'a'),
+                'Behavior2 stop',
+            ],
+        )
+        del res[:]
+        self.assertEqual(plb['a'], 1)
+        self.assertEqual(res, [('Behavior4 after', 'a')])
+
+        # Hooks following each other are flattened into one entrance.
+        @plumbing(Behavior1, Behavior3, Behavior4)
+        class HooksOnly(dict):
+            pass
+
+        entrance = HooksOnly.__dict__['__setitem__']
+        cells = [cell.cell_contents for cell in entrance.__closure__]
+        self.assertTrue(dict.__setitem__ in cells)
+
+        err = None
+        try:
+
+            @plumbing(Behavior1)
+            class Plumbing2(object):
+                __setitem__ = property(lambda self: None)
+        except PlumbingCollision as e:
+            err = e
+        finally:
+            self.assertEqual(err.left.__class__.__name__, 'before')
+
+    def test_batch(self):
+        res = list()
+
+        class Events(Behavior):
+            @plumb
+            def __setitem__(next_, self, key, value):
+                res.append(('event', key))
+                next_(self, key, value)
+
+        class Validate(Behavior):
+            @before
+            def __setitem__(self, key, value):
+                res.append(('validate', key))
+
+        class Lower(Behavior):
+            @plumb
+            def __setitem__(next_, self, key, value):
+                res.append(('lower', key))
+                next_(self, key.lower(), value)
+
+            @batch.of('__setitem__')
+            def setitems(next_, self, items):
+                res.append(('lower batch', len(items)))
+                next_(self, [(key.lower(), value) for key, value in items])
+
+        @plumbing(Events, Validate, Lower)
+        class Plumbing(dict):
+            pass
+
+        plb = Plumbing()
+        plb['A'] = 1
+        self.assertEqual(res, [('event', 'A'), ('validate', 'A'), ('lower', 'A')])
+        del res[:]
+        plb.setitems([('B', 2), ('C', 3)])
+        self.assertEqual(
+            res,
+            [
+                ('event', 'B'),
+                ('event', 'C'),
+                ('validate', 'B'),
+                ('validate', 'C'),
+                ('lower batch', 2),
+            ],
+        )
+        self.assertEqual(plb, {'a': 1, 'b': 2, 'c': 3})
+
+        class BatchEvents(Behavior):
+            @batch.of('__setitem__')
+            def setitems(next_, self, items):
+                res.append(('events batch', len(items)))
+                next_(self, items)
+
+        class Storage(dict):
+            def setitems(self, items):
+                res.append(('storage batch', len(items)))
+                self.update(items)
+
+        @plumbing(BatchEvents, Validate, Lower)
+        class BatchPlumbing(Storage):
+            pass
+
+        del res[:]
+        plb = BatchPlumbing()
+        plb.setitems([('B', 2), ('C', 3)])
+        self.assertEqual(
+            res,
+            [
+                ('events batch', 2),
+                ('validate', 'B'),
+                ('validate', 'C'),
+                ('lower batch', 2),
+                ('storage batch', 2),
+            ],
+        )
+        self.assertEqual(plb, {'b': 2, 'c': 3})
+
+        # Scalar layers are called per item, the batch is passed on once.
+        @plumbing(Events, Lower)
+        class ScalarPlumbing(Storage):
+            pass
+
+        del res[:]
+        plb = ScalarPlumbing()
+        plb.setitems([('B', 2), ('C', 3), ('D', 4)])
+        self.assertEqual(
+            res,
+            [
+                ('event', 'B'),
+                ('event', 'C'),
+                ('event', 'D'),
+                ('lower batch', 3),
+                ('storage batch', 3),
+            ],
+        )
+        self.assertEqual(plb, {'b': 2, 'c': 3, 'd': 4})
+
+        class Skip(Behavior):
+            @plumb
+            def __setitem__(next_, self, key, value):
+                if value is not None:
+                    next_(self, key, value)
+
+        @plumbing(Skip, Events, Lower)
+        class SkipPlumbing(Storage):
+            pass
+
+        del res[:]
+        plb = SkipPlumbing()
+        plb.setitems([('B', 2), ('C', None), ('D', 4)])
+        self.assertEqual(
+            res,
+            [('event', 'B'), ('event', 'D'), ('lower batch', 2), ('storage batch', 2)],
+        )
+        self.assertEqual(plb, {'b': 2, 'd': 4})
+
+        with self.assertRaises(PlumbingCollision):
+            batch(len, scalar='foo') + batch(len, scalar='bar')
+
+    def test_batch_suspended(self):
+        res = list()
+
+        class Events(Behavior):
+            @plumb
+            def __setitem__(next_, self, key, value):
+                res.append(('event', key))
+                next_(self, key, value)
+
+        class Lower(Behavior):
+            @plumb
+            def __setitem__(next_, self, key, value):
+                next_(self, key.lower(), value)  # pragma: no cover
+
+            @batch.of('__setitem__')
+            def setitems(next_, self, items):
+                res.append(('lower batch', len(items)))
+                next_(self, [(key.lower(), value) for key, value in items])
+
+        @plumbing(Events, Lower)
+        class Plumbing(dict):
+            pass
+
+        plb = Plumbing()
+        with suspended(plb, Events):
+            plb.setitems([('A', 1)])
+        self.assertEqual(res, [('lower batch', 1)])
+        del res[:]
+        # Scalar and batch layers of a suspended behavior are dropped.
+        with suspended(Plumbing, Lower):
+            plb.setitems([('B', 2)])
+        self.assertEqual(res, [('event', 'B')])
+        del res[:]
+        plb.setitems([('C', 3)])
+        self.assertEqual(res, [('event', 'C'), ('lower batch', 1)])
+        self.assertEqual(plb, {'a': 1, 'B': 2, 'c': 3})
+
+    def test_docstrings_joined(self):
+        class P1(Behavior):
+            """P1"""
+
+            @plumb
+            def foo(self):
+                """P1.foo"""
+
+            bar = plumb(property(None, None, None, 'P1.bar'))
+
+        class P2(Behavior):
+            @override
+            def foo(self):
+                """P2.foo"""
+
+            bar = plumb(property(None, None, None, 'P2.bar'))
+
+        @plumbing(P1, P2)
+        class Plumbing(object):
+            """Plumbing"""
+
+            bar = property(None, None, None, 'Plumbing.bar')
+
+        self.assertEqual(Plumbing.__doc__.strip(), 'Plumbing\n\nP1')
+        self.assertEqual(Plumbing.foo.__doc__.strip(), 'P2.foo\n\nP1.foo')
+        self.assertEqual(
+            Plumbing.bar.__doc__.strip(), 'Plumbing.bar\n\nP2.bar\n\nP1.bar'
+        )
+
+    def test_slots(self):
+        class P1(Behavior):
+            @default
+            def somewhing_which_writes_to_foo(self, foo_val):
+                self.foo = foo_val
+
+        @plumbing(P1)
+        class WithSlots(object):
+            __slots__ = 'foo'
+
+        self.assertEqual(type(WithSlots.__dict__['foo']).__name__, 'member_descriptor')
+        ob = WithSlots()
+        ob.somewhing_which_writes_to_foo('foo')
+        self.assertEqual(ob.foo, 'foo')
+
+    def test_zope_interface(self):
+        class IBase(Interface):
+            pass
+
+        @implementer(IBase)
+        class Base(object):
+            pass
+
+        self.assertTrue(IBase.implementedBy(Base))
+
+        class IBehavior1(Interface):
+            pass
+
+        @implementer(IBehavior1)
+        class Behavior1(Behavior):
+            blub = 1
+
+        class IBehavior2Base(Interface):
+            pass
+
+        @implementer(IBehavior2Base)
+        class Behavior2Base(Behavior):
+            pass
+
+        class IBehavior2(Interface):
+            pass
+
+        @implementer(IBehavior2)
+        class Behavior2(Behavior2Base):
+            pass
+
+        self.assertTrue(IBehavior1.implementedBy(Behavior1))
+        self.assertTrue(IBehavior2Base.implementedBy(Behavior2Base))
+        self.assertTrue(IBehavior2Base.implementedBy(Behavior2))
+        self.assertTrue(IBehavior2.implementedBy(Behavior2))
+
+        class IPlumbingClass(Interface):
+            pass
+
+        @implementer(IPlumbingClass)
+        @plumbing(Behavior1, Behavior2)
+        class PlumbingClass(Base):
+            pass
+
+        self.assertTrue(IPlumbingClass.implementedBy(PlumbingClass))
+        self.assertTrue(IBase.implementedBy(PlumbingClass))
+        self.assertTrue(IBehavior1.implementedBy(PlumbingClass))
+        self.assertTrue(IBehavior2.implementedBy(PlumbingClass))
+        self.assertTrue(IBehavior2Base.implementedBy(PlumbingClass))
+
+        plb = PlumbingClass()
+
+        self.assertTrue(IPlumbingClass.providedBy(plb))
+        self.assertTrue(IBase.providedBy(plb))
+        self.assertTrue(IBehavior1.providedBy(plb))
+        self.assertTrue(IBehavior2.providedBy(plb))
+        self.assertTrue(IBehavior2Base.providedBy(plb))
+
+
+class TestHasBehavior(unittest.TestCase):
+    def test_has_behavior(self):
+        class Behavior1(Behavior):
+            pass
+
+        class Behavior2(Behavior1):
+            pass
+
+        class Behavior3(Behavior):
+            pass
+
+        @plumbing(Behavior2)
+        class Plumbing(object):
+            pass
+
+        @plumbing(Behavior3)
+        class Sub(Plumbing):
+            pass
+
+        class Sub2(Sub):
+            pass
+
+        self.assertEqual(
+            Plumbing.__plumbing_behaviors__, frozenset([Behavior, Behavior1, Behavior2])
+        )
+        self.assertTrue(has_behavior(Plumbing, Behavior1))
+        self.assertTrue(has_behavior(Plumbing(), Behavior2))
+        self.assertFalse(has_behavior(Plumbing(), Behavior3))
+        self.assertTrue(has_behavior(Sub(), Behavior1))
+        self.assertTrue(has_behavior(Sub(), Behavior3))
+        self.assertTrue(has_behavior(Sub2, Behavior3))
+        self.assertFalse(has_behavior(object(), Behavior1))
+        self.assertFalse(has_behavior(dict, Behavior1))
+
+    def test_has_behavior_replumb(self):
+        def create_behavior():
+            class Reloaded(Behavior):
+                pass
+
+            return Reloaded
+
+        Reloaded = create_behavior()
+
+        @plumbing(Reloaded)
+        class Plumbing(object):
+            pass
+
+        class Sub(Plumbing, metaclass=plumber):
+            __plumbing__ = ()
+
+        Redefined = create_behavior()
+        replumb(Redefined)
+        self.assertFalse(has_behavior(Plumbing, Reloaded))
+        self.assertTrue(has_behavior(Plumbing, Redefined))
+        self.assertTrue(has_behavior(Sub, Redefined))
+
+
+class TestMemoryReport(unittest.TestCase):
+    def test_memory_report(self):
+        class Behavior1(Behavior):
+            """Behavior1."""
+
+            @plumb
+            def foo(next_, self):
+                """Behavior1.foo."""
+                return next_(self)
+
+        class Behavior2(Behavior):
+            @plumb
+            def foo(next_, self):
+                return next_(self)
+
+            @before
+            def bar(self):
+                pass
+
+        tracemalloc.start()
+        try:
+
+            @plumbing(Behavior1, Behavior2)
+            class Plumbing(object):
+                def foo(self):
+                    """Plumbing.foo."""
+
+                def bar(self):
+                    pass
+
+        finally:
+            tracemalloc.stop()
+
+        @plumbing(Behavior2)
+        class Sub(Plumbing):
+            pass
+
+        key = __name__ + ':' + Plumbing.__qualname__
+        report = memory_report(Plumbing)
+        self.assertEqual(list(report), [key])
+        report = report[key]
+        self.assertTrue(report['build'] > 0)
+        self.assertEqual(report['total'], sum(report['artifacts'].values()))
+        self.assertEqual(report['total'], sum(report['behaviors'].values()))
+        for kind in ('stacks', 'entrances', 'docstrings', 'instructions', 'namespace'):
+            self.assertTrue(report['artifacts'][kind] > 0)
+        self.assertEqual(report['artifacts']['variants'], 0)
+        behavior1 = __name__ + ':' + Behavior1.__qualname__
+        behavior2 = __name__ + ':' + Behavior2.__qualname__
+        self.assertTrue(report['behaviors'][behavior1] > 0)
+        self.assertTrue(report['behaviors'][behavior2] > 0)
+        self.assertTrue(report['behaviors'][None] > 0)
+
+        # Pipeline variants of suspended behaviors are artifacts as well.
+        with suspended(Plumbing, Behavior2):
+            Plumbing().foo()
+        report = memory_report(Plumbing)[key]
+        self.assertTrue(report['artifacts']['variants'] > 0)
+
+        # Classes are not measured before creation by tracemalloc.
+        report = memory_report(Sub)[__name__ + ':' + Sub.__qualname__]
+        self.assertEqual(report['build'], None)
+
+        reports = memory_report(sys.modules[__name__])
+        self.assertTrue(key in reports)
+        self.assertTrue(all(name.startswith(__name__ + ':') for name in reports))
+
+        summary = memory_report(summary=True)
+        self.assertTrue(summary['classes'] >= len(reports))
+        self.assertTrue(summary['build'] >= reports[key]['build'])
+        self.assertEqual(summary['total'], sum(summary['artifacts'].values()))
+
+
+class TestInplace(unittest.TestCase):
+    def test_inplace(self):
+        subclassed = list()
+
+        class Base(object):
+            def __init_subclass__(cls, **kw):
+                subclassed.append(cls.__name__)
+                super().__init_subclass__(**kw)
+
+            def foo(self):
+                return 'Base'
+
+        class Behavior1(Behavior):
+            @plumb
+            def foo(next_, self):
+                return 'Behavior1 ' + next_(self)
+
+            bar = default(computed(lambda: 'computed'))
+
+        class Plumbing(Base):
+            __slots__ = 'baz'
+
+            def foo(self):
+                return 'Plumbing ' + super().foo()
+
+        plumbing_class = Plumbing
+        decorated = plumbing(Behavior1, inplace=True)(Plumbing)
+        self.assertTrue(decorated is plumbing_class)
+        self.assertEqual(subclassed, ['Plumbing'])
+        self.assertEqual(Plumbing.__plumbing__, (Behavior1,))
+        self.assertEqual(Plumbing().foo(), 'Behavior1 Plumbing Base')
+        self.assertEqual(Plumbing.bar, 'computed')
+        self.assertEqual(Plumbing.__dict__['bar'], 'computed')
+        self.assertTrue(Plumbing in dependents(Behavior1))
+
+        plb = Plumbing()
+        plb.baz = 1
+        self.assertEqual(plb.baz, 1)
+
+        @plumbing(Behavior1, inplace=True)
+        class Sub(Plumbing):
+            pass
+
+        self.assertEqual(Sub().foo(), 'Behavior1 Behavior1 Plumbing Base')
+        self.assertFalse('bar' in Sub.__dict__)
+
+
+class TestPrecompile(unittest.TestCase):
+    def test_precompile(self):
+        modified = []
+
+        class recording(plumber):
+            def __setattr__(cls, name, value):
+                modified.append(name)
+                super(recording, cls).__setattr__(name, value)
+
+        class Behavior1(Behavior):
+            @plumb
+            def __getitem__(next_, self, key):
+                return 'Behavior1 ' + next_(self, key)
+
+            @plumb
+            def foo(next_, self):
+                return 'Behavior1 ' + next_(self)
+
+            @collect
+            def bar(self):
+                return 'Behavior1'
+
+            @plumbifexists
+            def baz(next_, self):
+                return next_(self)  # pragma: no cover
+
+        class Plumbing(dict, metaclass=recording):
+            __plumbing__ = Behavior1
+
+            def foo(self):
+                return 'Plumbing'
+
+        self.assertEqual(modified, [])
+        plb = Plumbing(a='a')
+        self.assertEqual(plb['a'], 'Behavior1 a')
+        self.assertEqual(plb.foo(), 'Behavior1 Plumbing')
+        self.assertEqual(plb.bar(), ['Behavior1'])
+        self.assertFalse(hasattr(plb, 'baz'))
+
+        stacks = Plumbing.__plumbing_stacks__
+        self.assertTrue(stacks.endpoints['__getitem__'] is dict.__getitem__)
+        self.assertTrue(stacks.entrances['foo'] is Plumbing.__dict__['foo'])
+
+        class Sub(Plumbing):
+            __plumbing__ = Behavior1
+
+        self.assertEqual(modified, [])
+        self.assertEqual(Sub(a='a')['a'], 'Behavior1 Behavior1 a')
+        self.assertEqual(len(Sub.__plumbing_stacks__.layers['__getitem__']), 2)
+
+    def test_installed_on_class(self):
+        # Endpoints not reliably known before class creation are looked up
+        # on the created class.
+        class Behavior1(Behavior):
+            @plumb
+            def foo(next_, self):
+                return 'Behavior1 ' + next_(self)
+
+        class Base1(object):
+            def foo(self):
+                return 'Base1'
+
+        class Base2(object):
+            def foo(self):
+                return 'Base2'  # pragma: no cover
+
+        class Plumbing(Base1, Base2, metaclass=plumber):
+            __plumbing__ = Behavior1
+
+        self.assertEqual(Plumbing().foo(), 'Behavior1 Base1')
+
+        class Behavior2(Behavior):
+            @plumb
+            def foo(next_, cls):
+                return 'Behavior2 ' + next_(cls)
+
+        class Plumbing(object, metaclass=plumber):
+            __plumbing__ = Behavior2
+
+            @classmethod
+            def foo(cls):
+                return cls.__name__
+
+        stacks = Plumbing.__plumbing_stacks__
+        self.assertEqual(stacks.endpoints['foo'](), 'Plumbing')
+
+
+class TestReplumb(unittest.TestCase):
+    def create_behavior(self, factor, with_default):
+        class ReloadedBehavior(Behavior):
+            @plumb
+            def foo(next_, self):
+                return factor * next_(self)
+
+            if with_default:
+                bar = default(factor)
+
+        return ReloadedBehavior
+
+    def test_replumb(self):
+        Behavior1 = self.create_behavior(2, True)
+
+        @plumbing(Behavior1)
+        class Plumbing(object):
+            def foo(self):
+                return 3
+
+            def baz(self):
+                return 'baz'
+
+        class Sub(Plumbing):
+            pass
+
+        class Behavior2(Behavior):
+            @plumb
+            def foo(next_, self):
+                return next_(self) + 1
+
+        @plumbing(Behavior2)
+        class PlumbingSub(Plumbing):
+            pass
+
+        self.assertEqual(set(dependents(Behavior1)), {Plumbing})
+        self.assertEqual(Plumbing().foo(), 6)
+        self.assertEqual(Plumbing.bar, 2)
+        self.assertEqual(Sub().foo(), 6)
+        self.assertEqual(PlumbingSub().foo(), 7)
+
+        baz = Plumbing.__dict__['baz']
+        Redefined = self.create_behavior(5, False)
+        replumb(Redefined)
+
+        self.assertEqual(Plumbing.__plumbing__, (Redefined,))
+        self.assertTrue(Plumbing in dependents(Redefined))
+        self.assertEqual(Plumbing().foo(), 15)
+        self.assertFalse(hasattr(Plumbing, 'bar'))
+        self.assertTrue(Plumbing.__dict__['baz'] is baz)
+        self.assertEqual(Sub().foo(), 15)
+        self.assertEqual(PlumbingSub().foo(), 16)
+
+    def test_replumb_extend(self):
+        def create_behavior(value):
+            class ExtendBehavior(Behavior):
+                names = extend(value)
+
+            return ExtendBehavior
+
+        class Base(object):
+            names = ('a',)
+
+        @plumbing(create_behavior(('b',)))
+        class Plumbing(Base):
+            pass
+
+        self.assertEqual(Plumbing.names, ('a', 'b'))
+        replumb(create_behavior(('c',)))
+        self.assertEqual(Plumbing.names, ('a', 'c'))
+
+
+class PickleBehavior(Behavior):
+    answer = default(42)
+
+    @plumb
+    def __getitem__(next_, self, key):
+        return 2 * next_(self, key)
+
+
+def make_local_plumbing():
+    @plumbing(PickleBehavior)
+    class LocalPlumbing(dict):
+        flag = True
+
+    return LocalPlumbing
+
+
+class TestLazyBehaviors(unittest.TestCase):
+    def test_resolve(self):
+        self.assertTrue(resolve(PickleBehavior) is PickleBehavior)
+        self.assertTrue(resolve(__name__ + '.PickleBehavior') is PickleBehavior)
+        self.assertTrue(resolve(__name__ + ':PickleBehavior') is PickleBehavior)
+        self.assertTrue(resolve(__name__ + ':TestLazyBehaviors') is TestLazyBehaviors)
+        with self.assertRaises(ImportError):
+            resolve('inexistent.module.Behavior')
+        with self.assertRaises(AttributeError):
+            resolve(__name__ + '.InexistentBehavior')
+
+    def test_dotted_path_behaviors(self):
+        @plumbing(
+            __name__ + '.PickleBehavior',
+            Conditional('inexistent.module.Behavior', False),
+        )
+        class Plumbing(dict):
+            pass
+
+        self.assertEqual(Plumbing.__plumbing__, (PickleBehavior,))
+        self.assertEqual(Plumbing.answer, 42)
+
+        class Plumbing2(dict, metaclass=plumber):
+            __plumbing__ = Conditional(__name__ + ':PickleBehavior', True)
+
+        self.assertEqual(Plumbing2.__plumbing__, (PickleBehavior,))
+
+
+@parametric
+def Scaled(factor=2):
+    class Scaled(Behavior):
+        @plumb
+        def __getitem__(next_, self, key):
+            return factor * next_(self, key)
+
+    return Scaled
+
+
+class TestParametric(unittest.TestCase):
+    def test_parametric(self):
+        self.assertTrue(Scaled(3) is Scaled(factor=3))
+        self.assertTrue(Scaled() is Scaled(2))
+        self.assertFalse(Scaled(3) is Scaled(4))
+        self.assertEqual(Scaled(3).__qualname__, 'Scaled(factor=3)')
+        self.assertEqual(Scaled(3).__parameters__, dict(factor=3))
+        self.assertEqual(repr(Scaled), '<parametric Scaled>')
+
+        @plumbing(Scaled(3))
+        class Plumbing(dict):
+            pass
+
+        @plumbing(Scaled)
+        class Plumbing2(dict):
+            pass
+
+        @plumbing(Scaled(factor=3), Scaled(3))
+        class Plumbing3(dict):
+            pass
+
+        self.assertEqual(Plumbing(a=1)['a'], 3)
+        self.assertEqual(Plumbing2.__plumbing__, (Scaled(2),))
+        self.assertEqual(Plumbing2(a=1)['a'], 2)
+        # Equal parametrizations provide the very same instructions.
+        self.assertEqual(len(Plumbing3.__plumbing_stacks__.layers['__getitem__']), 1)
+        self.assertEqual(Plumbing3(a=1)['a'], 3)
+        self.assertTrue(has_behavior(Plumbing, Scaled(3)))
+        self.assertFalse(has_behavior(Plumbing, Scaled(4)))
+
+        @parametric
+        def Invalid():
+            return object
+
+        with self.assertRaises(TypeError):
+            Invalid()
+
+        with self.assertRaises(TypeError) as cm:
+            Scaled(factor=[3])
+        self.assertEqual(
+            str(cm.exception), 'Parameters of Scaled must be hashable: factor'
+        )
+        self.assertTrue(Scaled((3,)) is Scaled((3,)))
+
+    def test_pickle_parametric(self):
+        self.assertTrue(pickle.loads(pickle.dumps(Scaled)) is Scaled)
+        self.assertTrue(pickle.loads(pickle.dumps(Scaled(5))) is Scaled(5))
+        compositions = sys.modules['plumber.plumber']._compositions
+
+        def make_plumbing():
+            @plumbing(Scaled(5))
+            class Plumbing(dict):
+                pass
+
+            return Plumbing
+
+        data = pickle.dumps(make_plumbing()(a=1))
+        compositions.clear()
+        loaded = pickle.loads(data)
+        self.assertEqual(type(loaded).__plumbing__, (Scaled(5),))
+        self.assertEqual(loaded['a'], 5)
+
+
+class TraceBehavior(Behavior):
+    @plumb
+    def __setitem__(next_, self, key, value):
+        next_(self, key, value)
+
+    @plumb
+    def update(next_, self, *args, **kw):
+        # Calls __setitem__, which is not recorded separately.
+        for key, value in dict(*args, **kw).items():
+            self[key] = value
+
+
+@plumbing(TraceBehavior)
+class TracePlumbing(dict):
+    pass
+
+
+class TestTracing(unittest.TestCase):
+    def test_record_and_replay(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'trace.jsonl')
+            entrance = TracePlumbing.__dict__['__setitem__']
+            with tracing.record(path, TracePlumbing):
+                self.assertFalse(TracePlumbing.__dict__['__setitem__'] is entrance)
+                plb = TracePlumbing()
+                plb['a'] = 1
+                plb.update(b=2, c=3)
+                TracePlumbing()['d'] = 4
+            self.assertTrue(TracePlumbing.__dict__['__setitem__'] is entrance)
+            self.assertEqual(plb, dict(a=1, b=2, c=3))
+
+            with open(path) as trace:
+                events = [json.loads(line) for line in trace]
+            self.assertEqual(
+                [(event['instance'], event['method']) for event in events],
+                [(0, '__setitem__'), (0, 'update'), (1, '__setitem__')],
+            )
+            key = __name__ + ':TracePlumbing'
+            self.assertEqual(events[0]['cls'], key)
+
+            latencies = tracing.replay(path)
+            self.assertEqual(latencies[(key, '__setitem__')].count, 2)
+            self.assertEqual(latencies[(key, 'update')].count, 1)
+            self.assertEqual(latencies[(key, 'update')].errors, 0)
+
+            # Replay against other classes.
+            @plumbing(TraceBehavior)
+            class Fresh(dict):
+                def __setitem__(self, key, value):
+                    raise ValueError(key)
+
+            latencies = tracing.replay(path, classes={key: Fresh})
+            self.assertEqual(latencies[(key, '__setitem__')].errors, 2)
+            self.assertEqual(latencies[(key, 'update')].errors, 1)
+            stats = latencies[(key, '__setitem__')]
+            self.assertTrue(stats.percentile(50) <= stats.percentile(99))
+            self.assertTrue(stats.mean > 0)
+            table = tracing.report(latencies).splitlines()
+            self.assertEqual(len(table), 3)
+            self.assertTrue(table[0].startswith('class'))
+
+    def test_serializer(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'trace.jsonl')
+            with tracing.record(path, serializer=json):
+                TracePlumbing()['a'] = [1]
+            with open(path) as trace:
+                event = json.loads(trace.read())
+            self.assertEqual(json.loads(event['text']), [['a', [1]], {}])
+            latencies = tracing.replay(path, serializer=json)
+            self.assertEqual(len(latencies), 1)
+
+
+class TestCoverage(unittest.TestCase):
+    def test_collect(self):
+        class Passing(Behavior):
+            @plumb
+            def foo(next_, self, value):
+                return next_(self, value)
+
+        class Changing(Behavior):
+            @plumb
+            def foo(next_, self, value):
+                return next_(self, value + 1)
+
+            @before
+            def bar(self):
+                pass
+
+        class Unused(Behavior):
+            @plumb
+            def bar(next_, self):
+                return next_(self)
+
+            @plumb
+            def baz(next_, self):
+                return next_(self)  # pragma: no cover
+
+        @plumbing(Passing, Changing, Unused)
+        class Plumbing(object):
+            def foo(self, value):
+                return value
+
+            def bar(self):
+                pass  # pragma: no cover
+
+            def baz(self):
+                pass  # pragma: no cover
+
+        entrance = Plumbing.__dict__['foo']
+        with coverage.collect(Plumbing, sample=2) as cov:
+            plb = Plumbing()
+            for _ in range(4):
+                self.assertEqual(plb.foo(1), 2)
+            self.assertFalse(Plumbing.__dict__['foo'] is entrance)
+        self.assertTrue(Plumbing.__dict__['foo'] is entrance)
+
+        cls = __name__ + ':' + Plumbing.__qualname__
+
+        def behavior(b):
+            return __name__ + ':' + b.__qualname__
+
+        layers = {(row['behavior'], row['method']): row for row in cov.report()}
+        passing = layers[(behavior(Passing), 'foo')]
+        self.assertEqual(passing['cls'], cls)
+        self.assertEqual(
+            (passing['calls'], passing['sampled'], passing['passthrough']), (4, 2, 2)
+        )
+        self.assertEqual(passing['status'], 'passthrough')
+        changing = layers[(behavior(Changing), 'foo')]
+        self.assertEqual((changing['calls'], changing['passthrough']), (4, 0))
+        self.assertEqual(changing['status'], 'active')
+        self.assertEqual(layers[(behavior(Unused), 'baz')]['status'], 'dead')
+        self.assertEqual(layers[(behavior(Changing), 'bar')]['passthrough'], None)
+        self.assertEqual(cov.dead_behaviors(), {cls: [behavior(Unused)]})
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'coverage.json')
+            cov.export(path)
+            with open(path) as file:
+                exported = json.load(file)
+        self.assertEqual(exported['dead_behaviors'], {cls: [behavior(Unused)]})
+        self.assertEqual(len(exported['layers']), 5)
+
+
+class FreezeBehavior(Behavior):
+    prefix = default('plumbed ')
+
+    @plumb
+    def __getitem__(next_, self, key):
+        return self.prefix + next_(self, key)
+
+    @before
+    def __setitem__(self, key, value):
+        self.log.append(('before', key))
+
+
+class FreezeAfterBehavior(Behavior):
+    @after
+    def __setitem__(self, key, value):
+        self.log.append(('after', key))
+
+
+class FreezeLockBehavior(Behavior):
+    @synchronized()
+    @plumb
+    def get(next_, self, key, default=None):
+        return next_(self, key, default)
+
+
+@plumbing(FreezeBehavior, FreezeAfterBehavior)
+class FreezePlumbing(dict):
+    """Frozen plumbing."""
+
+    def __init__(self, *args, **kw):
+        self.log = []
+        super().__init__(*args, **kw)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, json.dumps(value))
+
+
+@plumbing(FreezeAfterBehavior)
+class FreezeSubclass(FreezePlumbing):
+    prefix = 'sub '
+
+
+@plumbing(FreezeLockBehavior)
+class FreezeLocked(dict):
+    pass
+
+
+class TestFreeze(unittest.TestCase):
+    def test_freeze(self):
+        module = sys.modules[__name__]
+        source, skipped = freeze.freeze(module, frozen={__name__: 'frozen'})
+        self.assertEqual(
+            str(dict(skipped)[FreezeLocked]),
+            'synchronized pipelines can not be frozen',
+        )
+        namespace = dict(__name__='frozen')
+        exec(compile(source, 'frozen.py', 'exec'), namespace)
+        frozen = type(sys)('frozen')
+        frozen.__dict__.update(namespace)
+        self.assertTrue('FreezeLocked' not in frozen.__frozen__)
+        self.assertTrue('FreezeSubclass' in frozen.__frozen__)
+        self.assertTrue(frozen.FreezeLocked is FreezeLocked)
+
+        Frozen = frozen.FreezePlumbing
+        self.assertTrue(type(Frozen) is type)
+        self.assertEqual(Frozen.__doc__, 'Frozen plumbing.')
+        # Behaviors are not emitted, referring to them imports their modules.
+        self.assertFalse('__plumbing_behaviors__' in Frozen.__dict__)
+        # Only classes not frozen are imported from the live module.
+        self.assertEqual(
+            [
+                line
+                for line in source.splitlines()
+                if line.startswith('from %s ' % __name__)
+            ],
+            [
+                'from %s import FreezeLocked  # not frozen: '
+                'synchronized pipelines can not be frozen' % __name__
+            ],
+        )
+        plb = Frozen()
+        plb['a'] = 1
+        self.assertEqual(plb['a'], 'plumbed 1')
+        self.assertEqual(plb.log, [('before', 'a'), ('after', 'a')])
+        sub = frozen.FreezeSubclass()
+        sub['b'] = [2]
+        self.assertEqual(sub['b'], 'sub [2]')
+        self.assertEqual(sub.log, [('before', 'b'), ('after', 'b'), ('after', 'b')])
+        self.assertTrue(isinstance(sub, Frozen))
+
+        self.assertEqual(freeze.verify([(module, frozen)]), [])
+
+        # Modified frozen classes do not verify.
+        frozen.FreezeSubclass.prefix = 'other'
+        del Frozen.__getitem__
+        self.assertEqual(
+            freeze.verify([(module, frozen)]),
+            [
+                __name__ + ':FreezePlumbing.__getitem__: resolves differently',
+                __name__ + ':FreezeSubclass.__getitem__: resolves differently',
+                __name__ + ':FreezeSubclass.prefix: resolves differently',
+            ],
+        )
+
+    def test_same_code(self):
+        # Attributes of modules are loaded differently if the compiler knows
+        # the name refers to a module.
+        source = 'def f(value):\n    return json.dumps(value)\n'
+
+        def code(source):
+            module = compile(source, '<test>', 'exec')
+            return [c for c in module.co_consts if isinstance(c, types.CodeType)][0]
+
+        self.assertTrue(freeze.same_code(code(source), code('import json\n' + source)))
+        self.assertFalse(
+            freeze.same_code(code(source), code(source.replace('dumps', 'loads')))
+        )
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            module = os.path.join(tempdir, 'freezeme.py')
+            with open(module, 'w') as file:
+                file.write(
+                    'from plumber import Behavior, plumb, plumbing\n'
+                    '\n'
+                    'class Double(Behavior):\n'
+                    '    @plumb\n'
+                    '    def value(next_, self):\n'
+                    '        return 2 * next_(self)\n'
+                    '\n'
+                    '@plumbing(Double)\n'
+                    'class Plumbing:\n'
+                    '    def value(self):\n'
+                    '        return 21\n'
+                )
+            sys.path.insert(0, tempdir)
+            try:
+                out = os.path.join(tempdir, 'out')
+                os.mkdir(out)
+                self.assertEqual(freeze.main(['freezeme', '-o', out]), 0)
+                self.assertTrue(os.path.exists(os.path.join(out, 'freezeme_frozen.py')))
+                self.assertEqual(freeze.main(['freezeme', '-o', out, '--verify']), 0)
+                sys.modules.pop('freezeme')
+                import freezeme_frozen
+
+                self.assertEqual(freezeme_frozen.Plumbing().value(), 42)
+                # The frozen module does not import the live module.
+                self.assertFalse('freezeme' in sys.modules)
+            finally:
+                sys.path.remove(tempdir)
+                sys.path.remove(out)
+                sys.modules.pop('freezeme', None)
+                sys.modules.pop('freezeme_frozen', None)
+
+
+class TestPickling(unittest.TestCase):
+    def test_pickle_importable_plumbing_by_reference(self):
+        self.assertTrue(pickle.loads(pickle.dumps(PickleBehavior)) is PickleBehavior)
+
+    def test_pickle_local_plumbing(self):
+        compositions = sys.modules['plumber.plumber']._compositions
+        LocalPlumbing = make_local_plumbing()
+        self.assertEqual(
+            LocalPlumbing.__qualname__, 'make_local_plumbing.<locals>.LocalPlumbing'
+        )
+        plb = LocalPlumbing(a=1)
+        plb.attr = 'value'
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(plb, protocol))
+            self.assertTrue(type(loaded) is LocalPlumbing)
+            self.assertEqual(loaded.attr, 'value')
+            self.assertEqual(loaded['a'], 2)
+        # Rebuild from recipe in absence of the original class.
+        data = pickle.dumps([plb, plb])
+        compositions.clear()
+        loaded = pickle.loads(data)
+        rebuilt = type(loaded[0])
+        self.assertFalse(rebuilt is LocalPlumbing)
+        self.assertTrue(type(loaded[1]) is rebuilt)
+        self.assertEqual(rebuilt.__qualname__, LocalPlumbing.__qualname__)
+        self.assertEqual(rebuilt.__plumbing__, (PickleBehavior,))
+        self.assertTrue(rebuilt.flag)
+        self.assertEqual(rebuilt.answer, 42)
+        self.assertEqual(loaded[0]['a'], 2)
+        # Rebuilt class is taken from composition cache.
+        self.assertTrue(type(pickle.loads(data)[0]) is rebuilt)
+
+    def test_pickle_local_plumbing_subclass(self):
+        class Sub(make_local_plumbing()):
+            pass
+
+        loaded = pickle.loads(pickle.dumps(Sub(a=2)))
+        self.assertTrue(type(loaded) is Sub)
+        self.assertEqual(loaded['a'], 4)
 
 
 if __name__ == '__main__':